@@ -6,7 +6,6 @@ Compile and preprocess all files so that jekyll can build a static (github) page
 from __future__ import print_function
 from __future__ import absolute_import
 
-import codecs
 from functools import partial
 import logging
 import html
@@ -14,11 +13,15 @@ import os
 
 from . import common
 from . import config
+from . import dependencies
 from . import glossary
 from . import macros
-from .renderer import Renderer, filters
+from . import textio
+from .parallel import inherited_map
+from .renderer import Renderer, filters, load_source, source_digest
 from . import structure
 from . import template
+from .textio import OutputFile
 from .translate import translate as _
 
 
@@ -27,8 +30,13 @@ logger = logging.getLogger(__name__)
 
 class JekyllWriter(object):
 
-    def __init__(self):
-        pass
+    def __init__(self, jobs=None, cache_dir=None, keep=False):
+        # number of worker processes for making content pages
+        self.jobs = jobs
+        # directory for the manifest of the last build (None: always make all pages)
+        self.cache_dir = cache_dir
+        # keep the manifest for the next build in this process (e.g. with --watch)
+        self.keep = keep
 
     def configure(self):
         """Configure everything for the build."""
@@ -39,51 +47,95 @@ class JekyllWriter(object):
         macros.register_macro('define', glossary.glossary_definition_macro)
         macros.register_macro('html-menu', macros.MenuMacro.render)
 
-        # set up filters for renderer:
-        self.filters = [
-            partial(filters.MetadataFilter.filter, target_format=config.cfg.target_format),
+        # process glossary links (all renders share this filter, see _filters())
+        self.glossary_link_filter = glossary.get_glossary_link_processor('tooltip')
+
+    def _filters(self):
+        """Return new filters for rendering one node."""
+        return [
+            filters.MetadataFilter(target_format=config.cfg.target_format).filter,
             filters.remove_breaks_and_conts,
-            filters.SkipOnlyFilter.filter,
+            filters.SkipOnlyFilter().filter,
             partial(filters.convert_section_links, 'html'),
             macros.MacroFilter.filter,
-            glossary.get_glossary_link_processor('tooltip'),
+            self.glossary_link_filter,
             # filters.jekyll_front_matter is added below with some metadata added
         ]
 
     def build(self):
         """Render the jekyll output."""
 
+        if config.cfg.editions:
+            logger.warning("jekyll builds only the edition '%s'" % config.cfg.edition)
         self.configure()
 
+        manifest = self.get_manifest()
+
         # process templates _after_ registering macros!
-        template.process_templates_in_config()
+        template.process_templates_in_config(manifest)
+
+        # make content pages (only those that changed since the last build)
+        nodes = list(structure.structure.selected_nodes())
+        if manifest is None:
+            outdated = range(len(nodes))
+        else:
+            inputs = [self._page_input(node) for node in nodes]
+            outdated = [index for index, node in enumerate(nodes)
+                        if not manifest.is_current(self._target_path(node), inputs[index])]
+            logger.info("%s of %s pages are up to date" % (len(nodes) - len(outdated), len(nodes)))
+            textio.output_stats['unchanged'] += len(nodes) - len(outdated)
+        results = inherited_map(partial(dependencies.recorded_call, self._make_content_page),
+                                [nodes[index] for index in outdated], self.jobs,
+                                describe=lambda node: "page '%s'" % node.slug)
+        if manifest is not None:
+            for index, (_, recorded) in zip(outdated, results):
+                manifest.update(self._target_path(nodes[index]), inputs[index], recorded)
+            manifest.save()
+
+    def get_manifest(self):
+        """
+        Return the manifest of the last build of the current preset (see
+        dependencies.config_salt), None if there is no cache dir and the
+        manifest is not kept in memory.
+        """
+        preset = getattr(config.cfg, 'preset', None)
+        salt = dependencies.config_salt()
+        if self.cache_dir:
+            filename = os.path.join(self.cache_dir, 'manifest-%s.pickle' % preset)
+        else:
+            filename = None
+        if self.keep:
+            return dependencies.keep(('jekyll', preset), filename, salt)
+        if filename is None:
+            return None
+        return dependencies.Manifest(filename, salt)
+
+    def _target_path(self, node):
+        # target_path = os.path.join(config.cfg.target, md_filename(node.relpath))
+        return os.path.join(config.cfg.target, common.md_filename(node.slug))
 
-        # make content pages
-        current_node = structure.structure.parts[0]
-        while current_node:
-            logger.debug('node: "%s"' % current_node.slug)
-            self._make_content_page(current_node)
-            current_node = current_node.successor
+    def _page_input(self, node):
+        """Return the digest of the source and front matter of a page."""
+        return dependencies.digest(source_digest(node.source_path), self._page_metadata(node))
 
     def _make_content_page(self, node):
         """Copy each section to a separate file."""
-        # target_path = os.path.join(config.cfg.target, md_filename(node.relpath))
-        target_path = os.path.join(config.cfg.target, common.md_filename(node.slug))
-
-        with codecs.open(node.source_path, 'r', 'utf-8') as source:
-            with codecs.open(target_path, 'w+', 'utf-8') as target:
-                renderer = Renderer(source, filters=self.filters)
+        logger.debug('node: "%s"' % node.slug)
+        with OutputFile(self._target_path(node)) as target:
+            renderer = Renderer(load_source(node.source_path), filters=self._filters(), name=node.slug)
 
-                renderer.add_filter(partial(filters.jekyll_front_matter, self._page_metadata(node)))
-                renderer.add_filter(partial(filters.write, target))
-                renderer.render()
+            renderer.add_filter(partial(filters.jekyll_front_matter, self._page_metadata(node)))
+            renderer.add_filter(partial(filters.write, target))
+            renderer.render()
 
     def _page_metadata(self, node):
         metadata = {}
-        if node.predecessor:
-            metadata['prev_page_url'] = "%s.html" % node.predecessor.slug
-            metadata['prev_page_title'] = node.predecessor.title
-        if node.successor:
-            metadata['next_page_url'] = "%s.html" % node.successor.slug
-            metadata['next_page_title'] = node.successor.title
+        predecessor = node.predecessor
+        if predecessor:
+            metadata['prev_page_url'] = "%(slug)s.html" % predecessor.view
+            metadata['prev_page_title'] = predecessor.view['title']
+        successor = node.successor
+        if successor:
+            metadata['next_page_url'] = "%(slug)s.html" % successor.view
+            metadata['next_page_title'] = successor.view['title']
         return metadata
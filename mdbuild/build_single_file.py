@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""
+Base class for writers that compile all nodes into one file per edition (ebook, deckset).
+"""
+from __future__ import print_function
+from __future__ import absolute_import
+
+import abc
+from contextlib import ExitStack
+from functools import partial
+import io
+import logging
+
+from . import config
+from . import dependencies
+from . import glossary
+from . import macros
+from .common import edition_path
+from .parallel import inherited_map
+from .renderer import FanOutRenderer, edition_targets, filters, load_source, source_digest
+from . import structure
+from . import template
+from .textio import OutputFile
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFileWriter(abc.ABC):
+    """
+    Render all selected nodes, in reading order, into one target file for
+    each edition.
+
+    Nodes are rendered by up to jobs worker processes, then written in
+    reading order. With keep (e.g. with --watch), the rendered nodes are
+    kept in memory, and the next build in this process renders only nodes
+    whose source or dependencies changed.
+
+    Subclasses define:
+
+    NAME: the name of the kept manifest
+    SEPARATOR: written after each node
+    full_glossary_renderer(): the GlossaryRenderer for the full-glossary macro
+    _filters(): the filters for rendering one node, before <skip> and <only> tags
+    """
+    NAME = None
+    SEPARATOR = '\n\n'
+
+    def __init__(self, jobs=None, keep=False):
+        # number of worker processes for rendering nodes
+        self.jobs = jobs
+        # keep rendered nodes for the next build in this process (e.g. with --watch)
+        self.keep = keep
+
+    @abc.abstractmethod
+    def full_glossary_renderer(self):
+        """Return the GlossaryRenderer for the full-glossary macro."""
+
+    @abc.abstractmethod
+    def _filters(self):
+        """Return new filters for rendering one node, before <skip> and <only> tags."""
+
+    def configure(self):
+        """Configure everything for the build."""
+
+        # register all macros before processing templates
+        macros.register_macro('full-glossary', partial(glossary.full_glossary_macro, self.full_glossary_renderer()))
+        macros.register_macro('index', macros.IndexMacro.render)
+        macros.register_macro('glossary', glossary.glossary_term_macro)
+        macros.register_macro('define', glossary.glossary_definition_macro)
+
+        # process glossary links (all renders share this renderer, see _branch_filters())
+        if config.cfg.target_format == 'html':
+            style = 'tooltip'
+        else:
+            style = 'plain'
+        self.glossary_links = glossary.get_glossary_link_renderer(style)
+
+    def _branch_filters(self, target, outputs, header_offset):
+        """Return the filters for rendering one node for target, after <skip> and <only> tags."""
+        return [
+            partial(filters.convert_section_links, 'title'),
+            partial(macros.MacroFilter.filter, preset=target.preset),
+            filters.clean_images,
+            self.glossary_links.replace_glossary_references,
+            # processor.add_filter(partial(mdp.prefix_headline, headline_prefix))
+            partial(filters.increase_all_headline_levels, header_offset),
+            partial(filters.write, outputs[target]),
+        ]
+
+    def build(self):
+        """
+        Add all documents into one target file (one for each edition).
+        """
+        self.configure()
+        manifest = self.get_manifest()
+
+        # process templates _after_ registering macros!
+        template.process_templates_in_config(manifest)
+
+        targets = edition_targets()
+        with ExitStack() as stack:
+            outputs = {}
+            for target in targets:
+                path = config.cfg.target
+                if target is not targets[0]:
+                    path = edition_path(path, target.edition)
+                outputs[target] = stack.enter_context(OutputFile(path))
+                # start by copying the main template
+                if config.cfg.template:
+                    template.render_default_template(config.cfg.template, outputs[target])
+            # then append all the content pages, in reading order
+            nodes = list(structure.structure.selected_nodes())
+            for fragments, collected in self._render_nodes(nodes, targets, manifest):
+                for target in targets:
+                    outputs[target].write(fragments[target])
+                self.glossary_links.merge(collected)
+
+    def get_manifest(self):
+        """Return the manifest of the last build in this process, None if it is not kept."""
+        if not self.keep:
+            return None
+        return dependencies.keep((self.NAME, config.cfg.preset), None, dependencies.config_salt())
+
+    def _render_nodes(self, nodes, targets, manifest):
+        """
+        Return the rendered nodes (see _render_node()), reuse results
+        from the manifest for nodes whose source and dependencies did not change.
+        """
+        if manifest is None:
+            results = [None] * len(nodes)
+        else:
+            inputs = [dependencies.digest(source_digest(node.source_path), node.level) for node in nodes]
+            results = [manifest.result(node.id, input_digest) for node, input_digest in zip(nodes, inputs)]
+        outdated = [index for index, result in enumerate(results) if result is None]
+        logger.info("rendering %s of %s nodes" % (len(outdated), len(nodes)))
+        rendered = inherited_map(partial(dependencies.recorded_call, self._render_node, targets=targets),
+                                 [nodes[index] for index in outdated], self.jobs,
+                                 describe=lambda node: "node '%s'" % node.slug)
+        for index, (result, recorded) in zip(outdated, rendered):
+            results[index] = result
+            if manifest is not None:
+                manifest.set_result(nodes[index].id, inputs[index], recorded, result)
+        if manifest is not None:
+            manifest.prune_results(node.id for node in nodes)
+        return results
+
+    def _render_node(self, node, targets):
+        """
+        Return the content of node for each target, and the data
+        collected by the glossary link renderer.
+        """
+        fragments = dict((target, io.StringIO()) for target in targets)
+        self._append_content(fragments, node)
+        return (dict((target, fragment.getvalue()) for target, fragment in fragments.items()),
+                self.glossary_links.collected())
+
+    def _append_content(self, outputs, node):
+        """
+        Append content of one node to the outputs of all editions.
+        """
+        header_offset = config.cfg.header_offset + node.level - 1
+
+        renderer = FanOutRenderer(load_source(node.source_path), list(outputs), filters=self._filters(),
+                                  branch_filters=partial(self._branch_filters, outputs=outputs,
+                                                         header_offset=header_offset),
+                                  name=node.slug)
+        renderer.render()
+        for target in outputs.values():
+            target.write(self.SEPARATOR)
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+Persistent caches that let mdbuild skip work for source files that did not change.
+"""
+from __future__ import absolute_import
+
+import hashlib
+import logging
+import os
+import pickle
+
+from . import __version__
+
+logger = logging.getLogger(__name__)
+
+
+def file_digest(path):
+    """Return the hex digest of a file's content."""
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def make_salt(*args):
+    """Build a cache salt from the mdtools version and an arbitrary number of (repr-able) values."""
+    h = hashlib.sha1(__version__.encode('utf-8'))
+    for arg in args:
+        h.update(repr(arg).encode('utf-8'))
+    return h.hexdigest()
+
+
+def read_compiled(filename, salt):
+    """Return data stored by write_compiled() with the same salt, or None."""
+    try:
+        with open(filename, 'rb') as f:
+            stored_salt, data = pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.debug("ignoring unreadable compiled file '%s': %s" % (filename, e))
+        return None
+    if stored_salt != salt:
+        return None
+    return data
+
+
+def write_compiled(filename, salt, data):
+    """Store data (atomically) for read_compiled(), fail silently if filename is not writable."""
+    tmp_filename = '%s.%s.tmp' % (filename, os.getpid())
+    try:
+        with open(tmp_filename, 'wb') as f:
+            pickle.dump((salt, data), f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_filename, filename)
+    except OSError as e:
+        logger.debug("can't write compiled file '%s': %s" % (filename, e))
+
+
+class FileInfoCache(object):
+    """
+    A persistent cache for data extracted from source files, stored in one sidecar file.
+
+    Entries are keyed by source path. An entry is valid if size and mtime of
+    the source are unchanged, or (if they did change) the content hash still matches.
+
+    The salt invalidates the whole cache, it must change whenever the
+    extracted data would change for identical input (e.g. a new version
+    of mdtools, or a different set of macros).
+
+    Usage:
+
+    cache = FileInfoCache('.mdbuild-cache/info.pickle', salt)
+    value = cache.get(path)
+    if value is None:
+        value = expensive_extraction(path)
+        cache.set(path, value)
+    cache.save()
+    """
+
+    def __init__(self, filename, salt):
+        self.filename = filename
+        self.salt = salt
+        self.entries = {}
+        self.dirty = False
+        self.hits = 0
+        self.misses = 0
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.filename, 'rb') as f:
+                data = pickle.load(f)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            logger.warning("ignoring unreadable cache '%s': %s" % (self.filename, e))
+            return
+        if data.get('salt') != self.salt:
+            logger.info("cache '%s' is outdated" % self.filename)
+            self.dirty = True
+            return
+        self.entries = data['entries']
+
+    def save(self):
+        """Write the cache to disk (atomically), if it has changed."""
+        if not self.dirty:
+            return
+        # forget entries for files that were removed
+        self.entries = dict((path, entry) for path, entry in self.entries.items() if os.path.exists(path))
+        directory = os.path.dirname(self.filename)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_filename = '%s.%s.tmp' % (self.filename, os.getpid())
+        with open(tmp_filename, 'wb') as f:
+            pickle.dump({'salt': self.salt, 'entries': self.entries}, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_filename, self.filename)
+        self.dirty = False
+        logger.info("cache '%s': %s hits, %s misses" % (self.filename, self.hits, self.misses))
+
+    def get(self, path):
+        """Return the cached value for path, or None if there is no valid entry."""
+        entry = self.entries.get(path)
+        if entry is None:
+            self.misses += 1
+            return None
+        size, mtime, digest, value = entry
+        st = os.stat(path)
+        if (st.st_size, st.st_mtime_ns) != (size, mtime):
+            if st.st_size != size or file_digest(path) != digest:
+                self.misses += 1
+                return None
+            # touched, but not changed: remember the new mtime
+            self.entries[path] = (size, st.st_mtime_ns, digest, value)
+            self.dirty = True
+        self.hits += 1
+        return value
+
+    def set(self, path, value):
+        """Store the value for path."""
+        st = os.stat(path)
+        self.entries[path] = (st.st_size, st.st_mtime_ns, file_digest(path), value)
+        self.dirty = True
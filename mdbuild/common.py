@@ -3,20 +3,77 @@
 from __future__ import print_function
 
 from contextlib import contextmanager
+from functools import lru_cache
+import hashlib
+import importlib
+import logging
 import markdown
 import os
+import re
 import sys
 import yaml
 
+from .cache import make_salt, read_compiled, write_compiled
+
+logger = logging.getLogger(__name__)
 
 SLIDE_MARKERS = ['---', '***', '* * *']
 FILENAME_PATTERN = '%s.md'
 
+# use libyaml if available
+YAML_LOADER = getattr(yaml, 'CFullLoader', yaml.FullLoader)
+
+# directory for compiled copies of yaml files (None: always parse the yaml, see read_config_file)
+config_cache_dir = None
+
+# extensions for markdown2html
+MARKDOWN_EXTENSIONS = ('markdown.extensions.extra', 'markdown.extensions.meta')
+# number of conversions that convert_markdown remembers
+MARKDOWN_CACHE_SIZE = 4096
+
+# the backend for convert_markdown (see set_markdown_backend)
+markdown_backend = 'python-markdown'
+
+# idle markdown.Markdown instances by extensions (see convert_markdown)
+_converters = {}
+# parsers of the other backends by (backend, extensions)
+_parsers = {}
+
 
 def read_config_file(filename):
-    stream = open(filename, "r")
+    """
+    Read a yaml file.
+
+    If a cache directory is set (see set_config_cache_dir), a compiled copy
+    of the data is stored there and used instead of parsing the yaml as
+    long as the content does not change.
+    """
+    with open(filename, 'rb') as stream:
+        content = stream.read()
+    if not config_cache_dir:
+        return _parse_yaml(content)
+
+    path_digest = hashlib.sha1(os.path.abspath(filename).encode('utf-8')).hexdigest()
+    compiled_filename = os.path.join(config_cache_dir, 'config', '%s-%s.pickle' % (os.path.basename(filename), path_digest))
+    salt = make_salt(YAML_LOADER.__name__, hashlib.sha1(content).hexdigest())
+    data = read_compiled(compiled_filename, salt)
+    if data is None:
+        data = _parse_yaml(content)
+        try:
+            os.makedirs(os.path.dirname(compiled_filename), exist_ok=True)
+        except OSError as e:
+            logger.debug("can't create directory for compiled files: %s" % e)
+        write_compiled(compiled_filename, salt, data)
+    return data
+
+
+def set_config_cache_dir(directory):
+    globals()['config_cache_dir'] = directory
+
+
+def _parse_yaml(content):
     with disable_exception_traceback():
-        return yaml.load(stream, Loader=yaml.FullLoader)
+        return yaml.load(content, Loader=YAML_LOADER)
 
 
 def make_pathname(name):
@@ -27,6 +84,12 @@ def md_filename(name):
     return FILENAME_PATTERN % make_pathname(name)
 
 
+def edition_path(path, edition):
+    """Return the path for another edition of the output at path (e.g. book-print.md for book.md)."""
+    root, ext = os.path.splitext(path.rstrip('/'))
+    return '%s-%s%s' % (root, edition, ext)
+
+
 def create_directory(directory):
     if not os.path.exists(directory):
         os.mkdir(directory)
@@ -64,8 +127,120 @@ def make_headline_prefix(config, chapter_idx, section_idx):
         return None
 
 
+def set_markdown_backend(name):
+    """
+    Select the library for convert_markdown() and markdown2html():
+
+    - python-markdown (the default)
+    - markdown-it (markdown-it-py, plugins from mdit-py-plugins if installed)
+    - mistune
+
+    Fall back to python-markdown if the library is not installed.
+    """
+    if name not in MARKDOWN_BACKENDS:
+        logger.error("unknown markdown backend '%s' (choose from %s)" % (name, ', '.join(sorted(MARKDOWN_BACKENDS))))
+        sys.exit(1)
+    module = MARKDOWN_BACKENDS[name][0]
+    if module is not None:
+        try:
+            importlib.import_module(module)
+        except ImportError:
+            logger.warning("markdown backend '%s' is not installed, using python-markdown" % name)
+            name = 'python-markdown'
+    globals()['markdown_backend'] = name
+    convert_markdown.cache_clear()
+
+
+@lru_cache(maxsize=MARKDOWN_CACHE_SIZE)
+def convert_markdown(text, extensions=()):
+    """
+    Return the html for markdown text, like markdown.markdown(text, extensions=extensions).
+
+    The conversion is done by the selected backend (see set_markdown_backend).
+    Converters are reused instead of set up for each call, and the results for
+    the most recent (text, extensions) are cached. extensions must be a tuple
+    of Python-Markdown extensions, other backends enable their counterparts.
+    """
+    return MARKDOWN_BACKENDS[markdown_backend][1](text, extensions)
+
+
+def _python_markdown(text, extensions):
+    """Convert with a pooled markdown.Markdown, reset() after each use."""
+    idle = _converters.setdefault(extensions, [])
+    try:
+        converter = idle.pop()
+    except IndexError:
+        converter = markdown.Markdown(extensions=list(extensions))
+    try:
+        return converter.convert(text)
+    finally:
+        converter.reset()
+        idle.append(converter)
+
+
+META_PATTERN = re.compile(r'^[ ]{0,3}[A-Za-z0-9_-]+:')
+META_MORE_PATTERN = re.compile(r'^[ ]{4,}')
+
+
+def _strip_meta(text):
+    """Remove leading 'key: value' lines (and a blank line), like markdown.extensions.meta."""
+    lines = text.split('\n')
+    idx = 0
+    while idx < len(lines):
+        line = lines[idx]
+        if line.strip() == '':
+            idx += 1
+            break
+        if META_PATTERN.match(line) or (idx and META_MORE_PATTERN.match(line)):
+            idx += 1
+        else:
+            break
+    return '\n'.join(lines[idx:])
+
+
+def _markdown_it(text, extensions):
+    parser = _parsers.get(('markdown-it', extensions))
+    if parser is None:
+        from markdown_it import MarkdownIt
+        parser = MarkdownIt('commonmark', {'html': True})
+        if 'markdown.extensions.extra' in extensions:
+            parser.enable('table')
+            try:
+                from mdit_py_plugins.deflist import deflist_plugin
+                from mdit_py_plugins.footnote import footnote_plugin
+                parser.use(deflist_plugin).use(footnote_plugin)
+            except ImportError:
+                pass
+        _parsers[('markdown-it', extensions)] = parser
+    if 'markdown.extensions.meta' in extensions:
+        text = _strip_meta(text)
+    return parser.render(text).rstrip('\n')
+
+
+def _mistune(text, extensions):
+    parser = _parsers.get(('mistune', extensions))
+    if parser is None:
+        import mistune
+        plugins = []
+        if 'markdown.extensions.extra' in extensions:
+            plugins = ['table', 'footnotes', 'def_list']
+        parser = mistune.create_markdown(escape=False, plugins=plugins)
+        _parsers[('mistune', extensions)] = parser
+    if 'markdown.extensions.meta' in extensions:
+        text = _strip_meta(text)
+    return parser(text).rstrip('\n')
+
+
+# markdown backends: name -> (module, conversion function)
+MARKDOWN_BACKENDS = {
+    'python-markdown': (None, _python_markdown),
+    'markdown-it': ('markdown_it', _markdown_it),
+    'mistune': ('mistune', _mistune),
+}
+
+
 def markdown2html(text):
-    return markdown.markdown(text, extensions=['markdown.extensions.extra', 'markdown.extensions.meta'])
+    return convert_markdown(text, MARKDOWN_EXTENSIONS)
 
 
 class LineWriter(object):
@@ -19,12 +19,25 @@ config_system_defaults = {
     "noob-menu": False,
     "header-offset": 0,
     "edition": 'standard',
+    # more editions to build along with edition (ebook and deckset only)
+    "editions": [],
+    # library for converting markdown to html: python-markdown, markdown-it or mistune
+    # (falls back to python-markdown if not installed)
+    "markdown-backend": 'python-markdown',
+    # folder for persistent caches (set to an empty value to disable caching)
+    "cache-dir": '.mdbuild-cache',
 }
 
 
-def set_project_config(filename, preset=None):
-    """Get a config object for the selected preset."""
-    config_data = read_config_file(filename)
+def set_project_config(filename, preset=None, config_data=None):
+    """
+    Get a config object for the selected preset.
+
+    config_data is the content of the project file, if it was already read
+    (e.g. when building several presets).
+    """
+    if config_data is None:
+        config_data = read_config_file(filename)
 
     cfg = ConfigObject(config_system_defaults)
     cfg.update(config_data['defaults'])
@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+"""
+Dependencies of build outputs, for incremental builds.
+
+While an output (a page or a template) is rendered, code that reads shared
+data records what it read with record(kind, key):
+
+- ('glossary', term): a glossary entry (term None: the whole glossary)
+- ('translation', message): an entry of the translation memory
+- ('variable', name): a config variable
+- ('structure', None): slugs, titles, summaries, tags and hierarchy of all
+  nodes (e.g. for index and menu macros)
+
+A Manifest stores for each output the digest of its own input (e.g. source
+file and front matter), the digests of the recorded dependencies, and size
+and mtime of the output. On the next build, an output is current if all of
+these still match, and it doesn't need to be rendered again.
+
+Usage:
+
+manifest = Manifest('.mdbuild-cache/manifest-jekyll.pickle', salt)
+if not manifest.is_current(target_path, input_digest):
+    with recording() as recorded:
+        render(target_path)
+    manifest.update(target_path, input_digest, recorded)
+manifest.save()
+
+Writers that build repeatedly in one process (with --watch) get the same
+manifest from keep() each time, with the results of the last build.
+"""
+from __future__ import absolute_import
+
+from contextlib import contextmanager
+import hashlib
+import logging
+import os
+import pickle
+
+from .cache import make_salt
+
+logger = logging.getLogger(__name__)
+
+# dependencies of the output that is being rendered (None: nothing is recorded)
+recorded = None
+
+
+def record(kind, key=None):
+    """Record that the current output depends on (kind, key)."""
+    if recorded is not None:
+        recorded.add((kind, key))
+
+
+@contextmanager
+def recording():
+    """Record the dependencies of the with block in a set."""
+    previous = recorded
+    globals()['recorded'] = set()
+    try:
+        yield recorded
+    finally:
+        globals()['recorded'] = previous
+
+
+def recorded_call(function, *args, **kwargs):
+    """Return function(*args, **kwargs) and the dependencies it recorded."""
+    with recording() as recorded:
+        result = function(*args, **kwargs)
+    return result, recorded
+
+
+def digest(*values):
+    """Return a hex digest of (repr-able) values."""
+    h = hashlib.sha1()
+    for value in values:
+        h.update(repr(value).encode('utf-8'))
+    return h.hexdigest()
+
+
+def config_salt():
+    """
+    Return a salt for the manifest of the current preset.
+
+    Any change to the config (except variables, which outputs depend on
+    individually) or the registered macros changes the salt.
+    """
+    from . import config
+    from . import macros
+    settings = dict((key, value) for key, value in vars(config.cfg).items() if key != 'variables')
+    return make_salt(settings, macros.registered_macros())
+
+
+def current_value(kind, key):
+    """Return the current value of a dependency."""
+    # imported here, these modules record their dependencies
+    from . import config
+    from . import glossary
+    from . import structure
+    from . import translate
+    if kind == 'glossary':
+        if key is None:
+            return glossary.glossary
+        return glossary.glossary['terms'].get(key)
+    elif kind == 'translation':
+        return translate.translation_memory.get(key)
+    elif kind == 'variable':
+        return getattr(config.cfg.variables, key, None)
+    elif kind == 'structure':
+        return [(node.id, node.view) for node in structure.structure.walk()]
+    raise Exception("unknown dependency '%s'" % kind)
+
+
+class Manifest(object):
+    """
+    The dependencies of all outputs of the last build, stored in one file.
+
+    The salt invalidates the whole manifest, it must change whenever all
+    outputs could change (e.g. a new version of mdtools, or a different config).
+
+    Without a filename, the manifest is only kept in memory (see keep()). It
+    also holds results of renders that are not written to a file of their
+    own (e.g. the nodes of an ebook), these are never stored on disk.
+    """
+
+    def __init__(self, filename, salt):
+        self.filename = filename
+        self.salt = salt
+        # path -> (input digest, {(kind, key): digest}, (size, mtime) of the output)
+        self.outputs = {}
+        # key -> (input digest, {(kind, key): digest}, result)
+        self.results = {}
+        self.dirty = False
+        # digests of the current values of dependencies
+        self._digests = {}
+        self.load()
+
+    def load(self):
+        if self.filename is None:
+            return
+        try:
+            with open(self.filename, 'rb') as f:
+                data = pickle.load(f)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            logger.warning("ignoring unreadable manifest '%s': %s" % (self.filename, e))
+            return
+        if data.get('salt') != self.salt:
+            logger.info("manifest '%s' is outdated" % self.filename)
+            self.dirty = True
+            return
+        self.outputs = data['outputs']
+
+    def save(self):
+        """Write the manifest to disk (atomically), if it has changed."""
+        if not self.dirty or self.filename is None:
+            return
+        directory = os.path.dirname(self.filename)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_filename = '%s.%s.tmp' % (self.filename, os.getpid())
+        with open(tmp_filename, 'wb') as f:
+            pickle.dump({'salt': self.salt, 'outputs': self.outputs}, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_filename, self.filename)
+        self.dirty = False
+
+    def reset(self):
+        """Forget the digests of dependencies (their values may have changed since the last build)."""
+        self._digests = {}
+
+    def dependency_digest(self, kind, key):
+        """Return the digest of the current value of a dependency."""
+        try:
+            return self._digests[kind, key]
+        except KeyError:
+            value = self._digests[kind, key] = digest(current_value(kind, key))
+            return value
+
+    def _dependencies_current(self, dependencies):
+        for (kind, key), value in dependencies.items():
+            if self.dependency_digest(kind, key) != value:
+                return False
+        return True
+
+    def _dependency_digests(self, dependencies):
+        return dict((dependency, self.dependency_digest(*dependency)) for dependency in dependencies)
+
+    def is_current(self, path, input_digest):
+        """Return True if the output at path was made from the same input and dependencies."""
+        entry = self.outputs.get(path)
+        if entry is None:
+            return False
+        recorded_input, dependencies, output = entry
+        if recorded_input != input_digest:
+            return False
+        try:
+            st = os.stat(path)
+        except OSError:
+            return False
+        if (st.st_size, st.st_mtime_ns) != output:
+            return False
+        return self._dependencies_current(dependencies)
+
+    def update(self, path, input_digest, dependencies):
+        """Store input and dependencies of the output at path (after it was written)."""
+        st = os.stat(path)
+        self.outputs[path] = (input_digest, self._dependency_digests(dependencies), (st.st_size, st.st_mtime_ns))
+        self.dirty = True
+
+    def result(self, key, input_digest):
+        """Return the result for key if it was made from the same input and dependencies, otherwise None."""
+        entry = self.results.get(key)
+        if entry is None:
+            return None
+        recorded_input, dependencies, result = entry
+        if recorded_input != input_digest or not self._dependencies_current(dependencies):
+            return None
+        return result
+
+    def set_result(self, key, input_digest, dependencies, result):
+        """Store the result for key with its input and dependencies."""
+        self.results[key] = (input_digest, self._dependency_digests(dependencies), result)
+
+    def prune_results(self, keys):
+        """Forget the results for all other keys (e.g. of nodes that were removed)."""
+        keys = set(keys)
+        self.results = dict((key, entry) for key, entry in self.results.items() if key in keys)
+
+
+# manifests kept between builds in this process (see keep)
+_kept = {}
+
+
+def keep(name, filename, salt):
+    """
+    Return the manifest called name (e.g. for a preset) that was kept from
+    the last build in this process (e.g. with --watch), or a new one if the
+    salt changed.
+    """
+    manifest = _kept.get(name)
+    if manifest is None or manifest.filename != filename or manifest.salt != salt:
+        manifest = _kept[name] = Manifest(filename, salt)
+    manifest.reset()
+    return manifest
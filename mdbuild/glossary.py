@@ -4,32 +4,53 @@ from __future__ import absolute_import
 
 import html
 import logging
+import os
 from operator import itemgetter
 import re
 
 from .common import read_config_file, markdown2html
 from . import config
+from . import dependencies
+from .renderer.pipeline import filter_properties
+from .renderer.profile import substitute, substitute_lines
 
 logger = logging.getLogger(__name__)
 
 # The actual glossary
 glossary = {}
 
+# the file the glossary was read from
+_read_from = None
+
 
 def set_glossary(filename):
-    """Read glossary from file if name is given, otherwise return None."""
-    if filename:
+    """
+    Read glossary from file if name is given (unless it was already read
+    from that file), otherwise clear it.
+    """
+    if not filename:
+        globals()['glossary'] = {}
+        globals()['_read_from'] = None
+    elif filename != _read_from:
         g = read_config_file(filename)
         # add the glossary entrie's id to its dictionary (for use in templates)
         for term in g['terms']:
             g['terms'][term]['id'] = term
         globals()['glossary'] = g
+        globals()['_read_from'] = filename
+
+
+def files_changed(paths):
+    """Forget the glossary if it was read from one of paths (absolute paths)."""
+    if _read_from and os.path.abspath(_read_from) in paths:
+        set_glossary(None)
 
 
 def full_glossary_macro(renderer, config, structure):
     """
     Insert full glossary in alphabetical order.
     """
+    dependencies.record('glossary')
 
     glossary_contents = []
 
@@ -53,6 +74,7 @@ def glossary_definition_macro(renderer, config, term):
 
 def _expand_term(term, key, pattern):
     """Return glossary entry or definition."""
+    dependencies.record('glossary', term)
     try:
         return pattern % glossary['terms'][term][key]
     except KeyError:
@@ -157,19 +179,27 @@ class MarkdownGlossaryRenderer(GlossaryRenderer):
 
 
 def get_glossary_link_processor(style):
-    """Return a filter that processes glossary links."""
+    """
+    Return a filter that processes glossary links.
+
+    Each call returns the filter of a new GlossaryLinkRenderer, use the same
+    filter for all renders that share state (e.g. the footnotes of an ebook).
+    """
+    return get_glossary_link_renderer(style).replace_glossary_references
+
 
+def get_glossary_link_renderer(style):
+    """Return a new GlossaryLinkRenderer for style (see get_glossary_link_processor)."""
     if style == 'footnotes':
-        return GlossaryLinkFootnote.replace_glossary_references
+        return GlossaryLinkFootnote()
     elif style == 'underline':
-        return GlossaryLinkUnderline.replace_glossary_references
+        return GlossaryLinkUnderline()
     elif style == 'plain':
-        return GlossaryLinkPlain.replace_glossary_references
+        return GlossaryLinkPlain()
     elif style == 'tooltip':
-        return GlossaryLinkTooltip.replace_glossary_references
+        return GlossaryLinkTooltip()
     else:
-        GlossaryLinkMagic.INLINE_TEMPLATE = config.glossary_template
-        return GlossaryLinkMagic.replace_glossary_references
+        return GlossaryLinkMagic(config.glossary_template)
 
 
 class GlossaryLinkRenderer(object):
@@ -180,10 +210,10 @@ class GlossaryLinkRenderer(object):
     """
     GLOSSARY_LINK_PATTERN = re.compile(r'\[(?P<title>[^\]]*)\]\(glossary:(?P<glossary_term>[^)]*)\)')
 
-    @classmethod
-    def get_item_data(cls, match):
+    def get_item_data(self, match):
         """Return a dictionary with all data about the glossary item."""
         term = match.group('glossary_term')
+        dependencies.record('glossary', term)
         description = glossary['terms'][term]['glossary']
         return {
             'title': match.group('title'),  # the title of the reference
@@ -192,31 +222,46 @@ class GlossaryLinkRenderer(object):
             'description': description,  # the explanation of the term
         }
 
-    @classmethod
-    def additional_item_processing(cls, data):
+    def additional_item_processing(self, data):
         """Override for additional processing for each glossary item."""
         return data
 
-    @classmethod
-    def replace_callback(cls, match):
+    def replace_callback(self, match):
         """Replace each match of the regex."""
-        data = cls.get_item_data(match)
+        data = self.get_item_data(match)
         # do some additional stuff beyond replacing the glossary link inline:
-        data = cls.additional_item_processing(data)
-        return cls.INLINE_TEMPLATE % data
+        data = self.additional_item_processing(data)
+        return self.INLINE_TEMPLATE % data
 
-    @classmethod
-    def replace_glossary_references(cls, lines):
+    def replace_line(self, line):
+        """Replace all inline glossary references in one line."""
+        return substitute(self.GLOSSARY_LINK_PATTERN, self.replace_callback, line)
+
+    def replace_batch(self, lines):
+        """Replace all inline glossary references in a list of lines."""
+        return substitute_lines(self.GLOSSARY_LINK_PATTERN, self.replace_callback, '](glossary:', lines)
+
+    @filter_properties(sentinels=['](glossary:'], per_line='replace_line', per_batch='replace_batch')
+    def replace_glossary_references(self, lines):
         """Replace all inline glossary reference."""
         for line in lines:
-            line = cls.GLOSSARY_LINK_PATTERN.sub(cls.replace_callback, line)
-            yield line
+            yield self.replace_line(line)
 
-    @classmethod
-    def glossary_post_processing(cls, target):
+    def glossary_post_processing(self, target):
         """Override to do something when after the complete ebook is processed, e.g. insert footnotes."""
         pass
 
+    def collected(self):
+        """
+        Override to return the data collected for glossary_post_processing()
+        since the last call (e.g. for one node).
+        """
+        return None
+
+    def merge(self, collected):
+        """Override to add the collected() data of another instance (e.g. from a worker process)."""
+        pass
+
 
 class GlossaryLinkMagic(GlossaryLinkRenderer):
     """
@@ -227,6 +272,9 @@ class GlossaryLinkMagic(GlossaryLinkRenderer):
     """
     INLINE_TEMPLATE = ''
 
+    def __init__(self, inline_template):
+        self.INLINE_TEMPLATE = inline_template
+
 
 class GlossaryLinkPlain(GlossaryLinkRenderer):
     """Remove all glossary links (replace with link title)."""
@@ -238,8 +286,7 @@ class GlossaryLinkTooltip(GlossaryLinkRenderer):
     # INLINE_TEMPLATE = """<a href="#" class="tooltip" title="%(name)s: %(description)s">%(title)s</a>"""
     INLINE_TEMPLATE = """<a href="glossary.html#entry-%(term)s" class="glossary-tooltip" data-toggle="tooltip" title="%(name)s: %(description)s">%(title)s</a>"""
 
-    @classmethod
-    def additional_item_processing(cls, item_data):
+    def additional_item_processing(self, item_data):
         # buffer the explanation
         item_data['description'] = html.escape(item_data['description'])
         return item_data
@@ -254,17 +301,28 @@ class GlossaryLinkFootnote(GlossaryLinkRenderer):
 
     INLINE_TEMPLATE = """%(title)s[^%(term)s]"""
     FOOTNOTE_TEXT_TEMPLATE = """[^%(term)s]: %(name)s: %(description)s"""
-    buffer = {}
 
-    @classmethod
-    def additional_item_processing(cls, item_data):
+    def __init__(self):
+        # footnote texts by glossary term
+        self.buffer = {}
+        # footnote texts since the last call of collected()
+        self._collected = {}
+
+    def additional_item_processing(self, item_data):
         # buffer the explanation
-        cls.buffer[item_data['term']] = cls.FOOTNOTE_TEXT_TEMPLATE % item_data
+        self.buffer[item_data['term']] = self._collected[item_data['term']] = self.FOOTNOTE_TEXT_TEMPLATE % item_data
         return item_data
 
-    @classmethod
-    def glossary_post_processing(cls, target):
+    def collected(self):
+        collected = self._collected
+        self._collected = {}
+        return collected
+
+    def merge(self, collected):
+        self.buffer.update(collected)
+
+    def glossary_post_processing(self, target):
         """Emit all the buffered glossary items for footnotes."""
-        for key in sorted(cls.buffer.keys()):
-            target.write(cls.buffer[key])
+        for key in sorted(self.buffer.keys()):
+            target.write(self.buffer[key])
             target.write('\n\n')
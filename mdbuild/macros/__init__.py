@@ -1,5 +1,5 @@
 # -*- coding: utf-8 -*-
 
-from .core import register_macro, MacroFilter, IgnoreMacro
+from .core import clear_macros, register_macro, registered_macros, MacroFilter, IgnoreMacro
 
 from .index import IndexMacro, MenuMacro
@@ -26,6 +26,8 @@ import re
 
 from mdbuild import config
 from mdbuild import structure
+from mdbuild.renderer.pipeline import filter_properties
+from mdbuild.renderer.profile import substitute, substitute_lines
 
 logger = logging.getLogger(__name__)
 
@@ -41,10 +43,21 @@ def register_macro(name, function):
     globals()['macros'][name] = function
 
 
-def process_macro(match, ignore_unknown=False):
+def clear_macros():
+    """Unregister all macros (e.g. before building another preset)."""
+    macros.clear()
+
+
+def registered_macros():
+    """Return the names of all registered macros."""
+    return sorted(macros.keys())
+
+
+def process_macro(match, ignore_unknown=False, preset=None):
     """
     Extract macro name and parameters, call the registered
     macro handler and return the result.
+    skip and only are evaluated for preset (default: the preset of the config).
     TODO: handle vars and other substitutions
     """
     macro_string = match.group()[2:-2]
@@ -64,12 +77,14 @@ def process_macro(match, ignore_unknown=False):
         name = macro_string
 
     # process 'skip' and 'only':
+    if preset is None and ('skip' in kwargs or 'only' in kwargs):
+        preset = config.cfg.preset
     if 'skip' in kwargs:
-        if config.cfg.preset in kwargs['skip'].split('|'):
+        if preset in kwargs['skip'].split('|'):
             logger.debug("skipped macro '%s'" % name)
             return ''
     elif 'only' in kwargs:
-        if config.cfg.preset not in kwargs['only'].split('|'):
+        if preset not in kwargs['only'].split('|'):
             logger.debug("macro '%s' available only in other presets:" % name)
             return ''
 
@@ -85,10 +100,23 @@ class MacroFilter(object):
     MACRO_PATTERN = re.compile(r'\{\{.*?\}\}')
 
     @classmethod
-    def filter(cls, lines, ignore_unknown=False):
+    def expand(cls, line, ignore_unknown=False, preset=None):
+        """Expand all macros in one line."""
+        return substitute(cls.MACRO_PATTERN,
+                          partial(process_macro, ignore_unknown=ignore_unknown, preset=preset), line)
+
+    @classmethod
+    def expand_batch(cls, lines, ignore_unknown=False, preset=None):
+        """Expand all macros in a list of lines."""
+        return substitute_lines(cls.MACRO_PATTERN,
+                                partial(process_macro, ignore_unknown=ignore_unknown, preset=preset), '{{', lines)
+
+    @classmethod
+    @filter_properties(sentinels=['{{'], per_line='expand', per_batch='expand_batch')
+    def filter(cls, lines, ignore_unknown=False, preset=None):
+        """Expand macros, skip= and only= are evaluated for preset (default: the preset of the config)."""
         for line in lines:
-            line = cls.MACRO_PATTERN.sub(partial(process_macro, ignore_unknown=ignore_unknown), line)
-            yield line
+            yield cls.expand(line, ignore_unknown=ignore_unknown, preset=preset)
 
 
 class IgnoreMacro(object):
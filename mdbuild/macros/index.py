@@ -6,6 +6,7 @@ A macro that renders indexes.
 import logging
 from operator import attrgetter
 from textwrap import dedent, indent
+from mdbuild import dependencies
 from mdbuild.common import markdown2html
 
 
@@ -22,7 +23,9 @@ class IndexMacro(object):
         """Create a (sorted) index of pages.
 
         Parameters:
-            - tag: filter by tag before creating the index
+            - tag: filter by a tag expression before creating the index
+              (see structure.TagIndex), positional arguments like '-draft'
+              exclude nodes with that tag
             - root: only show children of one specific node (by slug)
             - sort: sort index by node attribute (mostly title)
             - force_format: force a specific format
@@ -31,6 +34,8 @@ class IndexMacro(object):
               - list: a list with one entry per item
         Examples:
             {{index:tag=pattern,sort=title}} create an index for all entries tagged 'pattern'
+            {{index:tag=pattern+governance|driver,-draft}} create an index for all entries
+                tagged 'pattern' and 'governance', or 'driver', but not 'draft'
             {{index:root=slug}} create an index of all children of node
             {{index:force_format=plain}} force a format (useful for
                 content-specific templates, not so much for content file)
@@ -38,6 +43,7 @@ class IndexMacro(object):
         sort and format default to None.
         root is processed before tag filter.
         """
+        dependencies.record('structure')
         # get arguments
         tag_filter = kwargs.get('tag')
         sort = kwargs.get('sort')
@@ -53,15 +59,11 @@ class IndexMacro(object):
                 return "{{index:root=%s ERRROR UNKNOWN ROOT}}" % kwargs['root']
 
         # select which nodes to show
-        nodes_to_show = []
         if tag_filter:
-            current_node = root
-            while current_node:
-                if tag_filter in current_node.tags:
-                    nodes_to_show.append(current_node)
-                current_node = current_node.successor
+            expressions = [tag_filter] + [arg for arg in args if arg.startswith('-')]
+            nodes_to_show = structure.tag_index.select(expressions, within=root)
         else:
-            nodes_to_show = root.parts[:]
+            nodes_to_show = list(root.parts)
 
         if sort:
             nodes_to_show.sort(key=attrgetter(sort))
@@ -90,7 +92,7 @@ class IndexMacro(object):
     def render_markdown(cls, nodes, template):
         res = []
         for node in nodes:
-            res.append(template % node.to_dict())
+            res.append(template % node.view)
         return ''.join(res)
 
     @classmethod
@@ -128,6 +130,7 @@ class MenuMacro(object):
 
     @classmethod
     def render(cls, config, structure, *args, **kwargs):
+        dependencies.record('structure')
         if not structure.parts:
             raise Exception("Can't render menu, menu parent has no parts!")
 
@@ -136,11 +139,7 @@ class MenuMacro(object):
     @classmethod
     def render_parts(cls, node, res, depth, noob_menu=False):
         for part in node.parts:
-            if 'menu-title' in part.metadata:
-                title = part.metadata['menu-title']
-            else:
-                title = part.title
-            item_html = """<li><a href="%s.html">%s</a>""" % (part.slug, title)
+            item_html = """<li><a href="%(slug)s.html">%(menu_title)s</a>""" % part.view
             res.append(cls.indent(item_html, depth))
             if part.parts:
                 res.append(cls.indent("<ul>", depth + 1))
@@ -9,48 +9,182 @@ from __future__ import print_function
 from __future__ import absolute_import
 
 import logging
+import os
 import sys
+import time
 import argparse
 
 from .build_jekyll import JekyllWriter
 from .build_ebook import EbookWriter
 from .build_deckset_slides import DecksetWriter
+from . import common
 from . import config
-from .structure import set_structure
-from .glossary import set_glossary
+from . import macros
+from . import structure
+from . import glossary
 from .template import template
+from . import textio
 from . import translate
+from . import watch
+from .renderer import profile, source
 
 logger = logging.getLogger(__name__)
 
 
 def build(args):
-    """Build from the selected configuration."""
+    """
+    Build from the selected configuration.
+
+    Several presets (separated by commas) are built one after the other in
+    this process. The project file is read once, glossary, translations and
+    the structure are kept for the next preset if it uses the same files
+    (see load_preset and set_structure), only the config of each preset
+    is applied.
+
+    With --watch, the presets are built again whenever one of their inputs
+    changes, until the build is interrupted (Ctrl-C).
+    """
 
     print('------- Starting Build ---------')
 
     logger.debug("args: %s" % repr(args))
 
-    setup(args)
+    logging_setup(args)
+    if args.profile_filters:
+        profile.enable_profiling()
+
+    presets = args.preset.split(',')
+    project_data = read_project_file(args)
+    inputs = build_presets(args, presets, project_data)
+    source.prune(content_files(inputs))
+
+    if profile.profiler:
+        print(profile.profiler.summary())
+
+    if getattr(args, 'watch', False):
+        watch_presets(args, presets, project_data, inputs)
+
+
+def build_presets(args, presets, project_data):
+    """Build presets, return the inputs of each preset (see preset_inputs) by preset."""
+    inputs = {}
+    for preset in presets:
+        if len(presets) > 1:
+            print("------- Preset '%s' ---------" % preset)
+        build_preset(args, preset, project_data)
+        inputs[preset] = preset_inputs(args)
+    return inputs
+
+
+def watch_presets(args, presets, project_data, inputs):
+    """
+    Build presets again whenever their inputs change.
+
+    Only presets with changed inputs are built. Project file, glossary,
+    translations and structures are kept unless their files changed, nodes
+    are read and rendered again only if their content file or the data
+    they depend on changed (see dependencies). Parsed sources are pruned
+    after all presets were built (the other presets still use theirs).
+    """
+    watcher = watch.get_watcher()
+    files, directories = watched_paths(inputs)
+    watcher.watch(files, directories)
+    print("------- Watching %s files and %s folders for changes (Ctrl-C to stop) ---------" % (len(files), len(directories)))
+    try:
+        while True:
+            changed = watcher.wait()
+            if not changed:
+                continue
+            print("------- Changed: %s ---------" % ', '.join(sorted(os.path.relpath(path) for path in changed)))
+            start = time.perf_counter()
+            try:
+                if os.path.abspath(args.project) in changed:
+                    project_data = read_project_file(args)
+                    affected = presets
+                else:
+                    affected = [preset for preset in presets
+                                if any(watch.is_input(path, *inputs[preset][:2]) for path in changed)]
+                glossary.files_changed(changed)
+                translate.files_changed(changed)
+                structure.files_changed(changed)
+                inputs.update(build_presets(args, affected, project_data))
+                if len(affected) == len(presets):
+                    source.prune(content_files(inputs))
+            except (Exception, SystemExit) as e:
+                # keep watching, the next change may fix the error
+                logger.error("build failed: %s" % (e or type(e).__name__))
+            watcher.watch(*watched_paths(inputs))
+            print("------- Rebuilt in %.2fs ---------" % (time.perf_counter() - start))
+    except KeyboardInterrupt:
+        print("------- Stopped watching ---------")
+    finally:
+        watcher.close()
+
+
+def preset_inputs(args):
+    """
+    Return the files and directories (absolute paths) the current preset
+    is built from, and the content files of its nodes (as they are loaded,
+    see source.load_source).
+    """
+    files = [args.project]
+    for name in ('structure', 'glossary', 'localization', 'template'):
+        path = getattr(config.cfg, name, None)
+        if path:
+            files.append(path)
+    for t in getattr(config.cfg, 'templates', None) or []:
+        source_path = getattr(t, 'source', None)
+        if source_path:
+            files.append(source_path)
+    directories = [config.cfg.source] if getattr(config.cfg, 'source', None) else []
+    return (frozenset(os.path.abspath(path) for path in files),
+            frozenset(os.path.abspath(path) for path in directories),
+            frozenset(node.source_path for node in structure.structure.walk()))
+
+
+def watched_paths(inputs):
+    """Return the files and directories of all presets in inputs."""
+    files = set()
+    directories = set()
+    for preset_files, preset_directories, preset_content in inputs.values():
+        files.update(preset_files)
+        directories.update(preset_directories)
+    return files, directories
+
+
+def content_files(inputs):
+    """Return the content files of all presets in inputs."""
+    return set().union(*(preset_content for preset_files, preset_directories, preset_content in inputs.values()))
+
+
+def build_preset(args, preset, project_data=None):
+    """Build one preset (project_data: the content of the project file, if it was already read)."""
+    load_preset(args, preset, project_data)
 
     # read structure
-    set_structure(config.cfg.structure, config.cfg.source)
+    if args.no_cache:
+        cache_dir = None
+    else:
+        cache_dir = config.cfg.cache_dir
+    structure.set_structure(config.cfg.structure, config.cfg.source, jobs=args.jobs, cache_dir=cache_dir, only=args.only)
 
     logger.info("selecting the renderer...")
+    # keep results in memory for rebuilds
+    keep = getattr(args, 'watch', False)
 
     # select and run the appropriate builder
     if config.cfg.renderer == 'jekyll':
-        j = JekyllWriter()
+        j = JekyllWriter(jobs=args.jobs, cache_dir=cache_dir, keep=keep)
         j.build()
     elif config.cfg.renderer == 'ebook':
-        e = EbookWriter()
+        e = EbookWriter(jobs=args.jobs, keep=keep)
         e.build()
     elif config.cfg.renderer == 'revealjs':
         logger.error("revealjs writer not ported to 2.0")
         sys.exit(1)
         # build_reveal_slides()
     elif config.cfg.renderer == 'deckset':
-        r = DecksetWriter()
+        r = DecksetWriter(jobs=args.jobs, keep=keep)
         r.build()
     elif config.cfg.renderer == 'wordpress':
         logger.error("Wordpress writer not ported to 2.0")
@@ -60,20 +194,60 @@ def build(args):
         logger.error("unknown renderer '%s' " % config.cfg.format)
         sys.exit(1)
 
+    print(textio.output_summary())
+
 
 def setup(args):
 
     # set up logger first
     logging_setup(args)
+    load_preset(args, args.preset)
+
+
+def read_project_file(args):
+    """
+    Return the content of the project file.
+
+    Its compiled copy is kept in the default cache dir, the cache dir of
+    the project (and of each preset) is only known after it was read.
+    """
+    if getattr(args, 'no_cache', False):
+        common.set_config_cache_dir(None)
+    else:
+        common.set_config_cache_dir(config.config_system_defaults['cache-dir'])
+    return common.read_config_file(args.project)
+
+
+def load_preset(args, preset, project_data=None):
+    """
+    Set up config, glossary and translations for a preset.
+
+    Glossary and translations are only read if the previous preset used
+    different files. Macros and output stats of the previous preset are
+    reset (each writer registers its own macros).
+    """
     logger.info("setting things up...")
+    macros.clear_macros()
+    textio.output_stats.update(changed=0, unchanged=0)
 
     # read config
-    config.set_project_config(args.project, args.preset)
+    if project_data is None:
+        project_data = read_project_file(args)
+    config.set_project_config(args.project, preset, project_data)
+    # compiled config files of the preset are stored in its cache dir
+    if getattr(args, 'no_cache', False):
+        common.set_config_cache_dir(None)
+    else:
+        common.set_config_cache_dir(config.cfg.cache_dir)
+    if getattr(args, 'editions', None):
+        config.cfg.set('editions', args.editions.split(','))
+    common.set_markdown_backend(config.cfg.markdown_backend)
     # build glossary (if defined)
     if config.cfg.glossary:
-        set_glossary(config.cfg.glossary)
+        glossary.set_glossary(config.cfg.glossary)
     else:
         logger.warning('no glossary defined!')
+        glossary.set_glossary(None)
 
     translate.read_translation_memory(config.cfg.localization)
 
@@ -116,8 +290,22 @@ def main_build():
         fromfile_prefix_chars='@'
     )
     parser.add_argument('--verbose', '-v', action='count', default=0)
+    parser.add_argument('--jobs', '-j', type=int, default=None,
+                        help="Number of worker processes for reading content files and rendering pages (default: no worker processes).")
+    parser.add_argument('--only', action='append', metavar='SLUG',
+                        help="Build only this node and its descendants (can be repeated).")
+    parser.add_argument('--profile-filters', action='store_true',
+                        help="Measure time, lines and substitutions per filter and node, print a summary after the build.")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="Ignore the persistent cache, parse all config files and read all content files.")
+    parser.add_argument('--editions', metavar='EDITIONS',
+                        help="Comma-separated editions to build along with the configured edition (ebook and deckset only).")
+    parser.add_argument('--watch', action='store_true',
+                        help="After the build, watch content, config, templates and translations, "
+                             "and build again when they change.")
     parser.add_argument('preset',
-                        help="The preset (defined in the project configuration file) to use for this build.")
+                        help="The preset (defined in the project configuration file) to use for this build, "
+                             "or several presets separated by commas (e.g. jekyll,epub,ebook).")
     parser.add_argument('project', help='the configuration file for the project (yaml)')
 
     args = parser.parse_args()
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+"""
+Helpers for running independent pieces of a build in worker processes.
+
+Workers are forked, so they inherit the read-only state of the parent
+(project config, glossary, translation memory, registered macros and the
+structure) without pickling it.
+
+ordered_map() is for work that writes output and logs (e.g. rendering
+pages): log records, errors, output stats (textio.output_stats) and filter
+profiles of each item are collected in the worker and reported by the
+parent in the order of the items. inherited_map() does the same for
+functions that can't be pickled (e.g. methods of a writer).
+"""
+from __future__ import absolute_import
+
+from collections import namedtuple
+from functools import partial
+import logging
+import multiprocessing
+import sys
+
+from . import textio
+from .renderer import profile
+
+logger = logging.getLogger(__name__)
+
+# the outcome of one item of ordered_map()
+WorkResult = namedtuple('WorkResult', ['value', 'error', 'records', 'output_stats', 'profiler'])
+
+# function and items of the running inherited_map(), inherited by worker processes
+_inherited = None
+
+
+def get_context():
+    """Return a multiprocessing context that forks, or None if the platform can't fork."""
+    try:
+        return multiprocessing.get_context('fork')
+    except ValueError:
+        return None
+
+
+def process_map(function, items, jobs=None, chunksize=None):
+    """
+    Return [function(item) for item in items], computed by up to jobs worker processes.
+
+    Results are returned in the order of items. If jobs is not set (or 1),
+    or if the platform can't fork, everything runs in the current process.
+    Exceptions raised by a worker are re-raised in the parent.
+    """
+    items = list(items)
+    if not jobs or jobs < 2 or len(items) < 2:
+        return [function(item) for item in items]
+    context = get_context()
+    if context is None:
+        logger.warning("can't fork worker processes on this platform, running serially")
+        return [function(item) for item in items]
+    if chunksize is None:
+        # a few chunks per worker keeps the load balanced without too much IPC
+        chunksize = max(1, len(items) // (jobs * 4))
+    with context.Pool(min(jobs, len(items))) as pool:
+        return pool.map(function, items, chunksize)
+
+
+class RecordBuffer(logging.Handler):
+    """Collect log records, so they can be sent to another process."""
+
+    def __init__(self):
+        super(RecordBuffer, self).__init__()
+        self.records = []
+
+    def emit(self, record):
+        # make the record picklable
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        record.msg = record.getMessage()
+        record.args = None
+        self.records.append(record)
+
+
+def run_captured(function, item):
+    """
+    Return a WorkResult for function(item).
+
+    Log records are collected instead of emitted, exceptions (and exits)
+    are returned as error message, output stats and profile only
+    contain this item.
+    """
+    buffer = RecordBuffer()
+    root_handlers = logging.root.handlers[:]
+    output_stats = dict(textio.output_stats)
+    profiler = profile.profiler
+    logging.root.handlers = [buffer]
+    textio.output_stats.update(changed=0, unchanged=0)
+    if profiler is not None:
+        profile.profiler = profile.FilterProfiler()
+    value = error = None
+    try:
+        value = function(item)
+    except SystemExit as e:
+        error = "exit (%s)" % e.code
+    except Exception as e:
+        logger.debug("traceback:", exc_info=True)
+        error = "%s: %s" % (e.__class__.__name__, e)
+    finally:
+        result = WorkResult(value, error, buffer.records, dict(textio.output_stats),
+                            profile.profiler if profiler is not None else None)
+        logging.root.handlers = root_handlers
+        textio.output_stats.update(output_stats)
+        profile.profiler = profiler
+    return result
+
+
+def ordered_map(function, items, jobs=None, describe=str):
+    """
+    Return [function(item) for item in items], computed by up to jobs worker processes.
+
+    With workers, the log records of each item are emitted in the order of
+    items after all items are done, followed by the error if the item failed
+    (describe(item) names the item). If any item failed, the build exits.
+    Without workers, this is the same as process_map().
+    """
+    items = list(items)
+    if not jobs or jobs < 2 or len(items) < 2:
+        return process_map(function, items)
+    results = process_map(partial(run_captured, function), items, jobs)
+    failed = 0
+    for item, result in zip(items, results):
+        for record in result.records:
+            logging.getLogger(record.name).handle(record)
+        if result.error is not None:
+            logger.error("%s: %s" % (describe(item), result.error))
+            failed += 1
+        for key, count in result.output_stats.items():
+            textio.output_stats[key] += count
+        if result.profiler is not None:
+            profile.profiler.merge(result.profiler)
+    if failed:
+        logger.error("%s of %s items failed" % (failed, len(items)))
+        sys.exit(1)
+    return [result.value for result in results]
+
+
+def _call_inherited(index):
+    function, items = _inherited
+    return function(items[index])
+
+
+def inherited_map(function, items, jobs=None, describe=str):
+    """
+    Return ordered_map(function, items, jobs, describe) for a function
+    that can't be pickled: workers inherit function and items, only the
+    index of each item is sent to them.
+    """
+    global _inherited
+    items = list(items)
+    _inherited = (function, items)
+    try:
+        return ordered_map(_call_inherited, range(len(items)), jobs,
+                           describe=lambda index: describe(items[index]))
+    finally:
+        _inherited = None
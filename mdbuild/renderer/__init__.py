@@ -1,4 +1,6 @@
 
-from .core import Renderer
+from .core import FanOutRenderer, Renderer
 from . import filters
-from .metadata import MetadataFilter
+from .metadata import MetadataFilter, scan_metadata
+from .skiponly import Target, current_target, edition_targets
+from .source import BatchedInput, ParsedSource, load_source, source_digest
@@ -6,6 +6,11 @@ from __future__ import absolute_import
 
 import logging
 
+from . import profile
+from .pipeline import batch_lines, compile_pipeline, is_batched, unbatch
+from .skiponly import SkipOnlyFanOut
+from .source import BatchedInput, ParsedSource
+
 logger = logging.getLogger(__name__)
 
 
@@ -24,19 +29,117 @@ class Renderer(object):
     renderer.add_filter(partial(write,target))
     # apply all filters to stream:
     renderer.render()
+
+    The pipeline is compiled before rendering (see pipeline.compile_pipeline),
+    unless optimize is False. Filters can be generators over lines, or stages
+    over batches of lines (see pipeline.is_batched), the renderer adapts
+    between them.
+
+    input is an iterable of lines, or a ParsedSource or BatchedInput
+    (see source.py) that is fed to the pipeline in batches.
+
+    name identifies the rendered content (e.g. the source file) when profiling filters.
     """
 
-    def __init__(self, input, filters=None):
-        self.pipeline = input
-        if filters:
-            for f in filters:
-                self.pipeline = f(self.pipeline)
+    def __init__(self, input, filters=None, name=None, optimize=True):
+        self.input = input
+        self.filters = list(filters) if filters else []
+        self.name = name
+        self.optimize = optimize
+        self.stages = None
 
     def add_filter(self, new_filter):
         """Add a filter to the pipeline."""
-        self.pipeline = new_filter(self.pipeline)
+        self.filters.append(new_filter)
+
+    def build_pipeline(self, batched_output=False):
+        """
+        Chain all filters, return the resulting iterator (over lines,
+        or over batches of lines if batched_output is True).
+        """
+        if self.optimize:
+            filters = compile_pipeline(self.filters)
+        else:
+            filters = self.filters
+        batched = False
+        if isinstance(self.input, (ParsedSource, BatchedInput)):
+            if self.optimize:
+                pipeline = self.input.batches()
+                batched = True
+            else:
+                pipeline = iter(self.input.lines)
+        else:
+            pipeline = iter(self.input)
+        if profile.profiler is not None:
+            self.stages = [profile.Stage(profile.FilterProfiler.INPUT)]
+            pipeline = profile.profiler.measure(self.stages[0], pipeline, batched)
+        for f in filters:
+            if is_batched(f) and not batched:
+                pipeline = batch_lines(pipeline)
+            elif batched and not is_batched(f):
+                pipeline = unbatch(pipeline)
+            batched = is_batched(f)
+            pipeline = f(pipeline)
+            if self.stages is not None:
+                self.stages.append(profile.Stage(profile.filter_name(f)))
+                pipeline = profile.profiler.measure(self.stages[-1], pipeline, batched)
+        if batched and not batched_output:
+            pipeline = unbatch(pipeline)
+        elif batched_output and not batched:
+            pipeline = batch_lines(pipeline)
+        return pipeline
 
     def render(self):
         """Process the stream."""
-        for line in self.pipeline:
+        for line in self.build_pipeline():
             pass
+        if self.stages is not None:
+            profile.profiler.record(self.name, self.stages)
+
+
+class FanOutRenderer(object):
+    """
+    Render one input for several targets (see skiponly.Target) in one pass.
+
+    Usage:
+
+    renderer = FanOutRenderer(load_source(path), targets,
+        # filters that don't depend on the target, they run once
+        filters=[filters.remove_breaks_and_conts],
+        # filters for each target, after <skip>/<only> tags were processed
+        branch_filters=lambda target: [partial(filters.write, outputs[target])])
+    renderer.render()
+
+    The input is read and run through filters once, then <skip> and <only>
+    tags are evaluated for all targets at the same time (see
+    skiponly.SkipOnlyFanOut). The lines of each target are rendered with
+    its own filters; branch_filters must not contain a SkipOnlyFilter.
+    The branches are rendered alternately, batch by batch, so the input
+    is streamed to all targets instead of being split up front.
+    """
+
+    def __init__(self, input, targets, branch_filters, filters=None, name=None, optimize=True):
+        self.input = input
+        self.targets = list(targets)
+        self.branch_filters = branch_filters
+        self.filters = list(filters) if filters else []
+        self.name = name
+        self.optimize = optimize
+
+    def render(self):
+        """Process the input and the lines of each target."""
+        shared = Renderer(self.input, filters=self.filters, name=self.name, optimize=self.optimize)
+        branches = SkipOnlyFanOut(self.targets).split(shared.build_pipeline(batched_output=True))
+        renderers = [Renderer(BatchedInput(batches), filters=self.branch_filters(target),
+                              name=self.name, optimize=self.optimize)
+                     for target, batches in zip(self.targets, branches)]
+        pipelines = [(renderer, renderer.build_pipeline(batched_output=True)) for renderer in renderers]
+        while pipelines:
+            # one batch of each branch, the others keep what they did not read yet
+            for renderer, pipeline in list(pipelines):
+                if next(pipeline, None) is None:
+                    pipelines.remove((renderer, pipeline))
+                    if renderer.stages is not None:
+                        profile.profiler.record(self.name, renderer.stages)
+        if shared.stages is not None:
+            profile.profiler.record(self.name, shared.stages)
@@ -1,13 +1,17 @@
 
+from functools import partial
 import logging
 import re
 import sys
 
 from mdbuild.common import SLIDE_MARKERS
 from mdbuild import config
+from mdbuild import dependencies
 from mdbuild.translate import translate as _
 
 from .common import HEADLINE_PATTERN
+from .pipeline import filter_properties
+from .profile import substitute, substitute_lines
 
 # make other filters from this package available here:
 from .skiponly import SkipOnlyFilter
@@ -28,6 +32,13 @@ def prefix_line(prefix, lines):
         yield "%s%s" % (prefix, line)
 
 
+def write_batches(target, batches):
+    for batch in batches:
+        target.write(''.join(batch))
+        yield batch
+
+
+@filter_properties(batch_filter=write_batches)
 def write(target, lines):
     for line in lines:
         target.write(line)
@@ -48,13 +59,18 @@ def prefix_headline(prefix, lines):
         yield line
 
 
+def increase_headline_level_line(level_increase, line):
+    if line.startswith('#'):
+        return ''.join(("#" * level_increase, line))
+    else:
+        return line
+
+
+@filter_properties(sentinels=['#'], per_line=increase_headline_level_line)
 def increase_all_headline_levels(level_increase, lines):
     """increase the level of ALL headlines."""
     for line in lines:
-        if line.startswith('#'):
-            yield ''.join(("#" * level_increase, line))
-        else:
-            yield line
+        yield increase_headline_level_line(level_increase, line)
 
 
 IMG_PATTERN = re.compile(r'^\!\[(?P<caption>.*)\]\((?P<url>.*)\)')
@@ -62,26 +78,35 @@ DECKSET_IMAGE_COMMANDS = ['inline', 'fit', 'left', 'right', 'original', 'filtere
 IMG_TEMPLATE = '![%s](%s)'
 
 
-def clean_images(lines):
-    """Remove deckset formatters like "inline,fit" from images, skip background images ([fit])."""
-
-    def clean_img(match):
-        caption = match.group('caption')
-        url = match.group('url')
-        if caption.lower() == 'fit':
-            # remove background image
-            return ''
+def _clean_img(match):
+    caption = match.group('caption')
+    url = match.group('url')
+    if caption.lower() == 'fit':
+        # remove background image
+        return ''
+    else:
+        for cmd in DECKSET_IMAGE_COMMANDS:
+            if caption.lower().startswith(cmd):
+                # strip caption
+                return IMG_TEMPLATE % ('', url)
         else:
-            for cmd in DECKSET_IMAGE_COMMANDS:
-                if caption.lower().startswith(cmd):
-                    # strip caption
-                    return IMG_TEMPLATE % ('', url)
-            else:
-                # leave unchanged
-                return IMG_TEMPLATE % (caption, url)
+            # leave unchanged
+            return IMG_TEMPLATE % (caption, url)
+
+
+def clean_image_line(line):
+    return substitute(IMG_PATTERN, _clean_img, line)
 
+
+def clean_image_batch(lines):
+    return substitute_lines(IMG_PATTERN, _clean_img, '![', lines)
+
+
+@filter_properties(sentinels=['!['], per_line=clean_image_line, per_batch=clean_image_batch)
+def clean_images(lines):
+    """Remove deckset formatters like "inline,fit" from images, skip background images ([fit])."""
     for line in lines:
-        yield IMG_PATTERN.sub(clean_img, line)
+        yield clean_image_line(line)
 
 
 def clean_images_old(lines):
@@ -104,6 +129,18 @@ FRONT_MATTER_TITLE = "title: \"%s\"\n"
 FRONT_MATTER_SEPARATOR = "---\n"
 
 
+def jekyll_front_matter_batches(metadata, batches):
+    """jekyll_front_matter() for batches of lines."""
+    batches = iter(batches)
+    for batch in batches:
+        if batch:
+            yield list(jekyll_front_matter(metadata, iter(batch)))
+            break
+    for batch in batches:
+        yield batch
+
+
+@filter_properties(batch_filter=jekyll_front_matter_batches)
 def jekyll_front_matter(metadata, lines):
     """
     Inject Jekyll front matter.
@@ -142,6 +179,12 @@ def jekyll_front_matter(metadata, lines):
         yield line
 
 
+def unescape_macros_line(line):
+    line = line.replace(r'\{', '{')
+    return line.replace(r'\}', '}')
+
+
+@filter_properties(sentinels=[r'\{', r'\}'], per_line=unescape_macros_line)
 def unescape_macros(lines):
     r"""
     Unescape macros in templates.
@@ -154,9 +197,7 @@ def unescape_macros(lines):
     variable.
     """
     for line in lines:
-        line = line.replace(r'\{', '{')
-        line = line.replace(r'\}', '}')
-        yield line
+        yield unescape_macros_line(line)
 
 
 SECTION_LINK_PATTERN = re.compile(r'\[(?P<title>[^\]]*)\]\(section:(?P<section>[^)]*)\)')
@@ -168,63 +209,97 @@ SECTION_LINK_TEMPLATES = {
 }
 
 
-def convert_section_links(style, lines):
-    """Convert section links for various output formats."""
+def _replace_section_link(template, match):
+    """Replace link with template."""
+    data = {
+        'title': match.group('title'),
+        'section': match.group('section'),
+    }
+    return template % data
+
+
+def _section_link_template(style):
     try:
-        template = SECTION_LINK_TEMPLATES[style]
+        return SECTION_LINK_TEMPLATES[style]
     except KeyError:
         logger.error('unknown section link style "%s"' % style)
         sys.exit(1)
 
-    def link_replace(match):
-        """Replace link with template."""
-        data = {
-            'title': match.group('title'),
-            'section': match.group('section'),
-        }
-        return template % data
 
+def convert_section_link_line(style, line):
+    template = _section_link_template(style)
+    return substitute(SECTION_LINK_PATTERN, partial(_replace_section_link, template), line)
+
+
+def convert_section_link_batch(style, lines):
+    template = _section_link_template(style)
+    return substitute_lines(SECTION_LINK_PATTERN, partial(_replace_section_link, template), '](section:', lines)
+
+
+@filter_properties(sentinels=['](section:'], per_line=convert_section_link_line,
+                   per_batch=convert_section_link_batch)
+def convert_section_links(style, lines):
+    """Convert section links for various output formats."""
     for line in lines:
-        line = SECTION_LINK_PATTERN.sub(link_replace, line)
-        yield line
+        yield convert_section_link_line(style, line)
+
 
+def remove_breaks_and_conts_line(line):
+    """Return None for slide breaks and continuation markers."""
+    if line.strip() in SLIDE_MARKERS:
+        return None
+    if line.strip().endswith(_(u"(…)")):
+        return None
+    return line
 
+
+@filter_properties(per_line=remove_breaks_and_conts_line)
 def remove_breaks_and_conts(lines):
     """
     Must be applied before jekyll_front_matter(), otherwise the front matter
     markers are removed.
     """
     for line in lines:
-        if line.strip() in SLIDE_MARKERS:
-            continue
-        if line.strip().endswith(_(u"(…)")):
-            continue
-        yield line
+        line = remove_breaks_and_conts_line(line)
+        if line is not None:
+            yield line
 
 
 TRANSLATION_MARKER = re.compile(r'\$\{_\("(?P<text>.*?)"\)\}')
 PARAMETER_MARKER = re.compile(r'\$\{(?P<name>.*?)\}')
 
 
+def _insert_translation(match):
+    text = match.group('text')
+    return _(text, warnings=True)
+
+
+def _insert_parameter(match):
+    name = match.group('name')
+    dependencies.record('variable', name)
+    try:
+        return getattr(config.cfg.variables, name)
+    except AttributeError:
+        logger.error("Unknown config variable '%s" % name)
+        return '${%s}' % name
+
+
+def inject_variables_and_translations_line(line):
+    line = substitute(TRANSLATION_MARKER, _insert_translation, line)
+    return substitute(PARAMETER_MARKER, _insert_parameter, line)
+
+
+def inject_variables_and_translations_batch(lines):
+    lines = substitute_lines(TRANSLATION_MARKER, _insert_translation, '${', lines)
+    return substitute_lines(PARAMETER_MARKER, _insert_parameter, '${', lines)
+
+
+@filter_properties(sentinels=['${'], per_line=inject_variables_and_translations_line,
+                   per_batch=inject_variables_and_translations_batch)
 def inject_variables_and_translations(lines):
     """
     Insert translations und config parameters marked in the text like
     ${_("a string to translate")} or ${my_parameter}.
     """
-
-    def insert_translation(match):
-        text = match.group('text')
-        return _(text, warnings=True)
-
-    def insert_parameter(match):
-        name = match.group('name')
-        try:
-            return getattr(config.cfg.variables, name)
-        except AttributeError:
-            logger.error("Unknown config variable '%s" % name)
-            return '${%s}' % name
-
     for line in lines:
-        line = TRANSLATION_MARKER.sub(insert_translation, line)
-        line = PARAMETER_MARKER.sub(insert_parameter, line)
-        yield line
+        yield inject_variables_and_translations_line(line)
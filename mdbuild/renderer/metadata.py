@@ -3,27 +3,28 @@ from __future__ import absolute_import
 import re
 from functools import partial
 import logging
-import markdown
+
+from mdbuild.common import convert_markdown
 
 from .common import HEADLINE_PATTERN
+from .pipeline import batch_lacks, filter_properties
 
 logger = logging.getLogger(__name__)
 
 
 class MetadataFilter(object):
-    """Process stream and extract/process metadata (title, summary etc.)"""
+    """
+    Process stream and extract/process metadata (title, summary etc.)
 
-    # extracted metadata (acessed from outside)
-    title = None
-    summary = None
-    metadata = None
+    Use a new instance for each render, the extracted metadata is available
+    as attributes afterwards:
 
-    # store next filter function to use
-    _filter_function = None
+    metadata_filter = MetadataFilter(target_format='html')
+    renderer = Renderer(source, filters=[metadata_filter.filter, ...])
+    renderer.render()
+    print(metadata_filter.title)
+    """
 
-    # internal buffer for summary
-    _summary_lines = None
-    
     METADATA_PATTERN = re.compile(r'\[\:(?P<key>.*?)\]: # \"(?P<value>.*?)\"')
     YAML_METADATA_PATTERN = re.compile(r'(?P<key>.*?):\w+\"(?P<value>.*?)\"')
     
@@ -55,8 +56,7 @@ class MetadataFilter(object):
         }
     }
 
-    @classmethod
-    def _header_filter(cls, line, after_metadata=False):
+    def _header_filter(self, line, after_metadata=False):
         """
         Read metadata up to (and including) first header. Inject
 
@@ -64,88 +64,116 @@ class MetadataFilter(object):
 
         Transition to normal filter after headline.
         """
-        if cls.METADATA_PATTERN.match(line.strip()) is not None:
+        if self.METADATA_PATTERN.match(line.strip()) is not None:
             # process metadata
-            match = cls.METADATA_PATTERN.match(line.strip())
+            match = self.METADATA_PATTERN.match(line.strip())
             key = match.groupdict()['key']
             value = match.groupdict()['value']
-            cls.metadata[key] = value
-            cls._filter_function = cls._header_filter
+            self.metadata[key] = value
+            self._filter_function = self._header_filter
             return None
 
         elif line.strip().startswith('#'):
             # process header
             match = HEADLINE_PATTERN.search(line)
             try:
-                cls.title = match.group('title')
+                self.title = match.group('title')
             except AttributeError:
                 logger.warning("title not set")
-                cls.title = ''
-            cls._filter_function = cls._standard_filter
+                self.title = ''
+            self._filter_function = self._standard_filter
             return line
 
         elif line.strip() == '':
             # process empty line
             if after_metadata:
-                cls._filter_function = cls._standard_filter
+                self._filter_function = self._standard_filter
                 return line
             else:
                 # ignore one blank line
-                cls._filter_function = partial(cls._header_filter, after_metadata=True)
+                self._filter_function = partial(self._header_filter, after_metadata=True)
                 return None
         else:
             raise Exception('Metadata must be followed by an empty line!')
 
 
-    @classmethod
-    def _summary_filter(cls, line):
+    def _summary_filter(self, line):
         """
         Read the summary and handle </summary>.
 
         Transition to standard filter after end of summary.
         """
-        if line.strip() == cls.END_SUMMARY:
-            cls._filter_function = cls._standard_filter
-            return cls.SUMMARY_MARKUP[cls.target_format][cls.END_SUMMARY]
+        if line.strip() == self.END_SUMMARY:
+            self._filter_function = self._standard_filter
+            if self.target_format == "html":
+                return self._summary_html() + self.SUMMARY_MARKUP[self.target_format][self.END_SUMMARY]
+            return self.SUMMARY_MARKUP[self.target_format][self.END_SUMMARY]
         else:
             # remove bold around summary if present
             if line.startswith("**") or line.startswith("__"):
                 sline = line.strip()[2:-2]
             else:
                 sline = line.strip()
-            cls._summary_lines.append(sline)
-            cls.summary = '\n'.join(cls._summary_lines)
+            self._summary_lines.append(sline)
+            self.summary = '\n'.join(self._summary_lines)
 
-            if cls.target_format == 'latex':
+            if self.target_format == 'latex':
                 # wrap summary in bold for latex (for now)
                 # TODO: add LaTeX markup for a proper box or something nice
                 if line.startswith("**") or line.startswith("__"):
                     pass
                 else:
                     line = "**%s**\n\n" % line.strip()
-            cls._filter_function = cls._summary_filter
-            if cls.target_format == "html":
-                # render to markdown (and strip <p>)
-                return markdown.markdown(line)[3:-4] + "\n"
+            self._filter_function = self._summary_filter
+            if self.target_format == "html":
+                # rendered at the end of the summary (see _summary_html())
+                self._summary_source.append(line)
+                return None
             else:
                 return line
 
-    @classmethod
-    def _standard_filter(cls, line):
+    def _summary_html(self):
+        """Return the html for the summary lines read so far (without <p> for one paragraph)."""
+        html = convert_markdown(''.join(self._summary_source))
+        self._summary_source = []
+        if html.startswith('<p>') and html.endswith('</p>') and html.count('<p>') == 1:
+            html = html[3:-4]
+        return html + "\n" if html else ""
+
+    def _standard_filter(self, line):
         """
         Read and return all other input
 
         Transition to summary filter on encountering summary tag.
         """
-        if line.strip() == cls.BEGIN_SUMMARY:
-            cls._filter_function = cls._summary_filter
-            return cls.SUMMARY_MARKUP[cls.target_format][cls.BEGIN_SUMMARY]
+        if line.strip() == self.BEGIN_SUMMARY:
+            self._filter_function = self._summary_filter
+            return self.SUMMARY_MARKUP[self.target_format][self.BEGIN_SUMMARY]
         else:
-            cls._filter_function = cls._standard_filter
+            self._filter_function = self._standard_filter
             return line
 
-    @classmethod
-    def filter(cls, lines, target_format=None):
+    def __init__(self, target_format=None):
+        if target_format not in self.SUMMARY_MARKUP:
+            raise Exception("Error: unknown target_format '%s'" % target_format)
+        self.target_format = target_format
+        self._start()
+
+    def _start(self):
+        """Reset the extracted metadata and the state machine."""
+        # extracted metadata (acessed from outside)
+        self.title = None
+        self.summary = None
+        self.metadata = {}
+        # internal buffer for summary
+        self._summary_lines = []
+        # summary lines to be rendered to html
+        self._summary_source = []
+        # store next filter function to use
+        self._filter_function = self._header_filter
+
+    @filter_properties(markers=[BEGIN_SUMMARY], batch_filter='filter_batches')
+    def filter(self, lines):
         """
         Extract title, summary and other metadata.
 
@@ -164,27 +192,97 @@ class MetadataFilter(object):
 
         https://stackoverflow.com/questions/44215896/markdown-metadata-format#44222826
 
-        TODO: figure out if an object-based (not class-based) approach is a cleaner
-            solution here?
-
-        Target Format:
+        Target Format (set when creating the filter):
             determines the output of metadata and summary tags
             html, epub: wrap summary in <p class=well-sm">
             latex: drop summary tag and wrap in ** if not already
             None (leave it as it is)
         """
-        # Initialize all class variables
-        cls.title = None
-        cls.summary = None
-        cls._summary_lines = []
-        cls.metadata = {}
-        cls.target_format = target_format
-
-        if target_format not in cls.SUMMARY_MARKUP:
-            raise Exception("Error: unknown target_format '%s'" % target_format)
-
-        cls._filter_function = cls._header_filter
+        self._start()
         for line in lines:
-            res = cls._filter_function(line)
+            res = self._filter_function(line)
             if res is not None:
                 yield res
+        if self._summary_source:
+            # unterminated summary
+            yield self._summary_html()
+
+    def filter_batches(self, batches):
+        """MetadataFilter.filter() for batches of lines."""
+        self._start()
+        for batch in batches:
+            if self._filter_function == self._standard_filter and (
+                    batch_lacks(batch, (self.BEGIN_SUMMARY,)) or self.BEGIN_SUMMARY not in ''.join(batch)):
+                # past the header, and no summary in this batch
+                yield batch
+                continue
+            result = []
+            for line in batch:
+                res = self._filter_function(line)
+                if res is not None:
+                    result.append(res)
+            yield result
+        if self._summary_source:
+            # unterminated summary
+            yield [self._summary_html()]
+
+
+def scan_metadata(lines, expand=None):
+    """
+    Return (title, summary, metadata) from the beginning of a document.
+
+    This yields the same title, metadata and (first) summary as
+    MetadataFilter.filter(), but reads only as far as necessary: scanning stops
+    after the end of the summary or, if there is no summary, at the first
+    paragraph after the headline.
+
+    expand is called for each line that is scanned (e.g. for expanding macros).
+    """
+    title = None
+    summary_lines = []
+    metadata = {}
+    state = 'header'
+    after_metadata = False
+    for line in lines:
+        if expand is not None:
+            line = expand(line)
+        if state == 'header':
+            match = MetadataFilter.METADATA_PATTERN.match(line.strip())
+            if match is not None:
+                metadata[match.group('key')] = match.group('value')
+            elif line.strip().startswith('#'):
+                match = HEADLINE_PATTERN.search(line)
+                try:
+                    title = match.group('title')
+                except AttributeError:
+                    logger.warning("title not set")
+                    title = ''
+                state = 'body'
+            elif line.strip() == '':
+                if after_metadata:
+                    state = 'body'
+                else:
+                    # ignore one blank line
+                    after_metadata = True
+            else:
+                raise Exception('Metadata must be followed by an empty line!')
+        elif state == 'body':
+            if line.strip() == MetadataFilter.BEGIN_SUMMARY:
+                state = 'summary'
+            elif line.strip() != '':
+                # first paragraph, there's no summary
+                break
+        else:  # summary
+            if line.strip() == MetadataFilter.END_SUMMARY:
+                break
+            # remove bold around summary if present
+            if line.startswith("**") or line.startswith("__"):
+                summary_lines.append(line.strip()[2:-2])
+            else:
+                summary_lines.append(line.strip())
+
+    if summary_lines:
+        summary = '\n'.join(summary_lines)
+    else:
+        summary = None
+    return title, summary, metadata
@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+"""
+Compile a list of filters into an efficient pipeline.
+
+Filters can declare properties with @filter_properties:
+
+- sentinels: substrings, one of which must be present in a line for the
+  filter to change it (e.g. '{{' for macros)
+- per_line: a function that processes one line (with the same arguments as
+  the filter, but a line instead of lines). It returns the processed line,
+  or None to drop the line. For classmethods this can be the name of
+  another classmethod (this applies to the functions below as well).
+- per_batch: a function that processes a batch (a list of lines) and
+  returns the list of processed lines. Defaults to applying per_line to
+  each line that contains a sentinel.
+- batch_filter: a version of the (stateful) filter that takes an iterator
+  of batches instead of lines, and yields batches
+- markers: substrings a (stateful) filter looks for, in addition to its
+  sentinels
+
+compile_pipeline() then
+
+- fuses adjacent per-line filters into one stage, that skips each filter
+  if none of its sentinels is in the batch or line, and leaves a batch
+  alone (after a single regex search) if it contains no sentinel at all,
+- replaces filters with their batch_filter.
+
+The filters of a fused stage still run their own substitutions one after
+another: a single substitution for all of them would not see text produced
+by an earlier filter (e.g. glossary links in expanded macros).
+
+Stages of the compiled pipeline pass batches of lines instead of single
+lines between each other wherever possible, which saves a generator
+resumption per line and stage. Filters without batched versions still
+work: batch_lines() and unbatch() adapt between the two kinds of stages.
+
+Filters without properties are never fused.
+
+All sentinels and markers are registered in MARKERS. Parsed sources (see
+source.py) record which of them occur in each block, batches read from a
+parsed source (MarkedBatch) let filters skip them without scanning the text.
+"""
+from __future__ import absolute_import
+
+from functools import partial
+from itertools import chain, islice
+import re
+from types import MethodType
+
+# number of lines in a batch read from the input
+BATCH_SIZE = 256
+
+# all sentinels and markers declared by filters
+MARKERS = set()
+
+
+def filter_properties(sentinels=None, per_line=None, per_batch=None, batch_filter=None, markers=None):
+    """Decorator that declares properties of a filter function (see module docs)."""
+    MARKERS.update(sentinels or ())
+    MARKERS.update(markers or ())
+
+    def decorate(f):
+        f.sentinels = tuple(sentinels) if sentinels else None
+        f.per_line = per_line
+        f.per_batch = per_batch
+        f.batch_filter = batch_filter
+        return f
+    return decorate
+
+
+class FilterSpec(object):
+    """A filter and its (resolved) properties."""
+
+    def __init__(self, f):
+        self.filter = f
+        func, args, keywords = f, (), {}
+        if isinstance(f, partial):
+            func, args, keywords = f.func, f.args, f.keywords
+        self.sentinels = getattr(func, 'sentinels', None)
+        self.per_line = self._resolve(func, 'per_line', args, keywords)
+        self.per_batch = self._resolve(func, 'per_batch', args, keywords)
+        if self.per_batch is None and self.per_line is not None:
+            self.per_batch = partial(apply_per_line, self.sentinels, self.per_line)
+        self.batch_filter = self._resolve(func, 'batch_filter', args, keywords)
+
+    @staticmethod
+    def _resolve(func, name, args, keywords):
+        """Return the function declared as property name, with the arguments of the filter."""
+        f = getattr(func, name, None)
+        if isinstance(f, str):
+            # name of a method of the same class
+            f = getattr(func.__self__, f)
+        if f is not None and (args or keywords):
+            f = partial(f, *args, **keywords)
+        return f
+
+
+def apply_per_line(sentinels, per_line, batch):
+    """
+    Apply per_line to all lines of batch that contain one of the sentinels (or all lines).
+
+    Return batch itself if no line was changed.
+    """
+    if sentinels is not None:
+        text = ''.join(batch)
+        for sentinel in sentinels:
+            if sentinel in text:
+                break
+        else:
+            return batch
+    result = []
+    changed = False
+    for line in batch:
+        if sentinels is not None:
+            for sentinel in sentinels:
+                if sentinel in line:
+                    break
+            else:
+                result.append(line)
+                continue
+        new_line = per_line(line)
+        if new_line is not line:
+            changed = True
+        if new_line is not None:
+            result.append(new_line)
+    return result if changed else batch
+
+
+def batch_lines(lines, size=BATCH_SIZE):
+    """Adapter: turn an iterator of lines into an iterator of batches (lists of lines)."""
+    lines = iter(lines)
+    while True:
+        batch = list(islice(lines, size))
+        if not batch:
+            return
+        yield batch
+
+
+def unbatch(batches):
+    """Adapter: turn an iterator of batches into an iterator of lines."""
+    return chain.from_iterable(batches)
+
+
+class MarkedBatch(list):
+    """
+    A batch of unchanged source lines that knows which markers occur in it.
+
+    scanned is the set of markers that were searched for, markers the
+    ones that were found. Filters return a new list when they change a
+    batch, so the markers of a MarkedBatch are always up to date.
+    """
+    __slots__ = ('markers', 'scanned')
+
+    def __init__(self, lines, markers, scanned):
+        list.__init__(self, lines)
+        self.markers = markers
+        self.scanned = scanned
+
+
+def batch_lacks(batch, markers):
+    """Return True if batch is known to contain none of markers (without scanning it)."""
+    scanned = getattr(batch, 'scanned', None)
+    if scanned is None:
+        return False
+    return batch.markers.isdisjoint(markers) and scanned.issuperset(markers)
+
+
+class BatchedFilter(object):
+    """The batch_filter of a filter, as a stage of a compiled pipeline."""
+    batched = True
+
+    def __init__(self, spec):
+        self.spec = spec
+        self.__name__ = filter_name(spec.filter)
+
+    def __call__(self, batches):
+        return self.spec.batch_filter(batches)
+
+
+class FusedFilter(object):
+    """Run several per-line filters in one stage that processes batches."""
+    batched = True
+
+    def __init__(self, specs):
+        self.specs = specs
+        self.steps = [(spec.sentinels, spec.per_batch) for spec in specs]
+        sentinels = set()
+        for spec in specs:
+            if spec.sentinels is None:
+                # this filter must see every line
+                sentinels = None
+                break
+            sentinels.update(spec.sentinels)
+        if sentinels is None:
+            self.gate = None
+        else:
+            self.gate = re.compile('|'.join(re.escape(s) for s in sorted(sentinels)))
+        self.sentinels = sentinels
+        self.__name__ = 'fused(%s)' % ', '.join(filter_name(spec.filter) for spec in specs)
+
+    def process_batch(self, batch):
+        """Return the list of processed lines."""
+        if self.gate is not None and (batch_lacks(batch, self.sentinels) or
+                                      self.gate.search(''.join(batch)) is None):
+            # none of the filters would change this batch
+            return batch
+        for sentinels, per_batch in self.steps:
+            if sentinels is not None and batch_lacks(batch, sentinels):
+                continue
+            batch = per_batch(batch)
+        return batch
+
+    def __call__(self, batches):
+        process_batch = self.process_batch
+        for batch in batches:
+            yield process_batch(batch)
+
+
+def filter_name(f):
+    """Return a readable name for a filter function (or partial)."""
+    while isinstance(f, partial):
+        f = f.func
+    if isinstance(getattr(f, '__self__', None), type):
+        # classmethod: use the actual class, not the one that defines the method
+        return '%s.%s' % (f.__self__.__name__, f.__name__)
+    if isinstance(f, MethodType):
+        # same for methods of filter instances
+        return '%s.%s' % (type(f.__self__).__name__, f.__name__)
+    return getattr(f, '__qualname__', None) or getattr(f, '__name__', None) or repr(f)
+
+
+def is_batched(stage):
+    """Return True if stage processes batches instead of lines."""
+    return getattr(stage, 'batched', False)
+
+
+def compile_pipeline(filters):
+    """
+    Return a list of stages that produces the same output as filters, only faster.
+
+    Stages either process lines or batches (see is_batched()).
+    """
+    stages = []
+    group = []
+    for spec in (FilterSpec(f) for f in filters):
+        if spec.per_batch is not None:
+            group.append(spec)
+            continue
+        if group:
+            stages.append(FusedFilter(group))
+            group = []
+        if spec.batch_filter is not None:
+            stages.append(BatchedFilter(spec))
+        else:
+            stages.append(spec.filter)
+    if group:
+        stages.append(FusedFilter(group))
+    return stages
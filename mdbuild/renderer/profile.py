@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+Opt-in profiling of the filters in a Renderer pipeline.
+
+When profiling is enabled, each stage of a pipeline is wrapped in a generator
+that records the time spent in the stage (excluding the time of the stages
+before it), the number of lines it emits and the number of regex substitutions
+made through substitute() or substitute_lines().
+
+Usage:
+
+profile.enable_profiling()
+# ... render
+print(profile.profiler.summary())
+"""
+from __future__ import print_function
+from __future__ import absolute_import
+
+import time
+
+from .pipeline import filter_name
+
+# the active profiler (None if profiling is disabled)
+profiler = None
+
+
+def enable_profiling():
+    globals()['profiler'] = FilterProfiler()
+    return profiler
+
+
+def substitute(pattern, repl, line):
+    """pattern.sub(repl, line), counts substitutions if profiling is enabled."""
+    if profiler is None:
+        return pattern.sub(repl, line)
+    line, count = pattern.subn(repl, line)
+    profiler.count_substitutions(count)
+    return line
+
+
+def substitute_lines(pattern, repl, sentinel, lines):
+    """
+    Return lines with substitute() applied to each line that contains sentinel.
+
+    Return lines itself if no line was changed.
+    """
+    if sentinel not in ''.join(lines):
+        return lines
+    result = []
+    changed = False
+    for line in lines:
+        if sentinel in line:
+            new_line = substitute(pattern, repl, line)
+            if new_line != line:
+                changed = True
+            line = new_line
+        result.append(line)
+    return result if changed else lines
+
+
+class Stage(object):
+    """Measurements for one stage of a pipeline."""
+    __slots__ = ('name', 'time', 'lines_in', 'lines_out', 'substitutions', 'renders')
+
+    def __init__(self, name):
+        self.name = name
+        self.time = 0.0
+        self.lines_in = 0
+        self.lines_out = 0
+        self.substitutions = 0
+        self.renders = 0
+
+    def add(self, other):
+        self.time += other.time
+        self.lines_in += other.lines_in
+        self.lines_out += other.lines_out
+        self.substitutions += other.substitutions
+        self.renders += 1
+
+    def merge(self, other):
+        """Add the totals of other (e.g. measured in a worker process)."""
+        self.time += other.time
+        self.lines_in += other.lines_in
+        self.lines_out += other.lines_out
+        self.substitutions += other.substitutions
+        self.renders += other.renders
+
+
+class FilterProfiler(object):
+    """Collect measurements per filter and per node (the name of the renderer)."""
+
+    INPUT = '<input>'
+
+    def __init__(self):
+        self.filters = {}
+        self.nodes = {}
+        self._stack = []
+        self._mark = 0.0
+
+    def measure(self, stage, upstream, batched=False):
+        """Yield from upstream, attribute the time spent there to stage."""
+        lines = iter(upstream)
+        while True:
+            self._enter(stage)
+            try:
+                line = next(lines)
+            except StopIteration:
+                return
+            finally:
+                self._leave()
+            stage.lines_out += len(line) if batched else 1
+            yield line
+
+    def _enter(self, stage):
+        now = time.perf_counter()
+        if self._stack:
+            self._stack[-1].time += now - self._mark
+        self._stack.append(stage)
+        self._mark = now
+
+    def _leave(self):
+        now = time.perf_counter()
+        self._stack.pop().time += now - self._mark
+        self._mark = now
+
+    def count_substitutions(self, count):
+        if self._stack:
+            self._stack[-1].substitutions += count
+
+    def record(self, node, stages):
+        """Add the stages of one finished render."""
+        for previous, stage in zip(stages, stages[1:]):
+            stage.lines_in = previous.lines_out
+        node_stage = self.nodes.setdefault(node, Stage(node))
+        for stage in stages:
+            self.filters.setdefault(stage.name, Stage(stage.name)).add(stage)
+            node_stage.time += stage.time
+        node_stage.renders += 1
+
+    def merge(self, other):
+        """Add all measurements of another profiler (e.g. from a worker process)."""
+        for name, stage in other.filters.items():
+            self.filters.setdefault(name, Stage(name)).merge(stage)
+        for name, stage in other.nodes.items():
+            self.nodes.setdefault(name, Stage(name)).merge(stage)
+
+    def summary(self, max_nodes=20):
+        """Return a report of all filters and the slowest nodes, sorted by time."""
+        total = sum(stage.time for stage in self.filters.values()) or 1.0
+        res = ['------- Filter Profile ---------',
+               '%10s %6s %10s %10s %10s  %s' % ('time (ms)', '%', 'lines in', 'lines out', 'subst.', 'filter')]
+        for stage in sorted(self.filters.values(), key=lambda s: s.time, reverse=True):
+            res.append('%10.1f %6.1f %10d %10d %10d  %s' % (
+                stage.time * 1000, stage.time * 100 / total, stage.lines_in,
+                stage.lines_out, stage.substitutions, stage.name))
+        res.append('')
+        res.append('%10s %6s %10s  %s' % ('time (ms)', '%', 'renders', 'node'))
+        nodes = sorted(self.nodes.values(), key=lambda s: s.time, reverse=True)
+        for stage in nodes[:max_nodes]:
+            res.append('%10.1f %6.1f %10d  %s' % (
+                stage.time * 1000, stage.time * 100 / total, stage.renders, stage.name))
+        if len(nodes) > max_nodes:
+            res.append('(%s more nodes)' % (len(nodes) - max_nodes))
+        return '\n'.join(res)
@@ -7,10 +7,27 @@ import logging
 from mdbuild.common import disable_exception_traceback
 from mdbuild import config
 
-from collections import namedtuple
+from .pipeline import batch_lacks, filter_properties
+
+from collections import deque, namedtuple
 
 logger = logging.getLogger(__name__)
 
+# the configuration that <skip> and <only> tags are evaluated for
+Target = namedtuple('Target', ['preset', 'edition', 'target_format'])
+
+
+def current_target():
+    """Return the Target of the current config."""
+    return Target(getattr(config.cfg, 'preset', None), config.cfg.edition, config.cfg.target_format)
+
+
+def edition_targets():
+    """Return the Targets of config.edition and all further config.editions."""
+    target = current_target()
+    editions = [e for e in getattr(config.cfg, 'editions', []) if e != target.edition]
+    return [target] + [target._replace(edition=e) for e in editions]
+
 
 class SkipOnlyFilter(object):
     """
@@ -24,6 +41,11 @@ class SkipOnlyFilter(object):
             some text
         </only>
     </skip>
+
+    Use a new instance for each render (e.g. SkipOnlyFilter().filter).
+    Tags are evaluated for the current config, or for the Target passed
+    to the constructor. SkipOnlyFanOut evaluates them for several targets
+    in one pass.
      """
 
     State = namedtuple('State', ['pass_through', 'tag'])
@@ -31,70 +53,175 @@ class SkipOnlyFilter(object):
     CLOSE_TAG = re.compile(r"</(?P<tag>(skip)|(only))>")
     PARAMETERS = re.compile(r"((formats=\"(?P<formats>.*?)\")|(editions=\"(?P<editions>.*?)\")|(presets=\"(?P<presets>.*?)\"))+")
 
+    def __init__(self, target=None):
+        # the Target to render for (default: the current config)
+        self.target = target
+        # the states of the enclosing tags
+        self.stack = []
+
     @classmethod
-    def filter(cls, lines):
-        # Initialize all class variables
-        state = cls.State(pass_through=True, tag=None)
-        cls.stack = []
-        for line in lines:
-            if cls.OPEN_TAG.match(line.strip()) is not None:
-                # <skip …> or <only …>
-                match = cls.OPEN_TAG.match(line.strip())
-                tag = match.groupdict()['tag']
-                # find and expand parameters
-                parameters = match.groupdict()['parameters']
-                match = cls.PARAMETERS.match(parameters)
-                if match is None:
-                    with disable_exception_traceback():
-                        raise Exception("line does not compute: %s" % line)
-                try:
-                    presets = match.groupdict()['presets'].split(',')
-                except AttributeError:
-                    presets = []
-                try:
-                    editions = match.groupdict()['editions'].split(',')
-                except AttributeError:
-                    editions = []
-                try:
-                    formats = match.groupdict()['formats'].split(',')
-                except AttributeError:
-                    formats = []
-
-                # first 'naive' guess at pass_through
-                if tag == 'only':
-                    pass_through = False
-                    if config.cfg.preset in presets:
-                        pass_through = True
-                    if config.cfg.edition in editions:
-                        pass_through = True
-                    if config.cfg.target_format in formats:
-                        pass_through = True
-                elif tag == 'skip':
+    def parse_tag(cls, line):
+        """
+        Return ('open', tag, presets, editions, formats) or ('close', tag)
+        if line is a <skip>/<only> tag, otherwise None.
+        """
+        match = cls.OPEN_TAG.match(line.strip())
+        if match is not None:
+            # <skip …> or <only …>
+            tag = match.groupdict()['tag']
+            # find and expand parameters
+            parameters = match.groupdict()['parameters']
+            match = cls.PARAMETERS.match(parameters)
+            if match is None:
+                with disable_exception_traceback():
+                    raise Exception("line does not compute: %s" % line)
+            try:
+                presets = match.groupdict()['presets'].split(',')
+            except AttributeError:
+                presets = []
+            try:
+                editions = match.groupdict()['editions'].split(',')
+            except AttributeError:
+                editions = []
+            try:
+                formats = match.groupdict()['formats'].split(',')
+            except AttributeError:
+                formats = []
+            return ('open', tag, presets, editions, formats)
+        match = cls.CLOSE_TAG.match(line.strip())
+        if match is not None:
+            return ('close', match.groupdict()['tag'])
+        return None
+
+    def apply_tag(self, state, parsed_tag):
+        """Return the state after a tag (see parse_tag())."""
+        if parsed_tag[0] == 'open':
+            _, tag, presets, editions, formats = parsed_tag
+            if self.target is None:
+                self.target = current_target()
+            # first 'naive' guess at pass_through
+            if tag == 'only':
+                pass_through = False
+                if self.target.preset in presets:
                     pass_through = True
-                    if config.cfg.preset in presets:
-                        pass_through = False
-                    if config.cfg.edition in editions:
-                        pass_through = False
-                    if config.cfg.target_format in formats:
-                        pass_through = False
-                if not state.pass_through:
-                    # if parent is blocking, this content is also blocked!
+                if self.target.edition in editions:
+                    pass_through = True
+                if self.target.target_format in formats:
+                    pass_through = True
+            elif tag == 'skip':
+                pass_through = True
+                if self.target.preset in presets:
+                    pass_through = False
+                if self.target.edition in editions:
                     pass_through = False
-                cls.stack.append(state)
-                state = cls.State(pass_through=pass_through, tag=tag)
-            elif cls.CLOSE_TAG.match(line.strip()) is not None:
-                match = cls.CLOSE_TAG.match(line.strip())
-                tag = match.groupdict()['tag']
-                if tag == state.tag:
-                    state = cls.stack.pop()
+                if self.target.target_format in formats:
+                    pass_through = False
+            if not state.pass_through:
+                # if parent is blocking, this content is also blocked!
+                pass_through = False
+            self.stack.append(state)
+            return self.State(pass_through=pass_through, tag=tag)
+        else:
+            tag = parsed_tag[1]
+            if tag == state.tag:
+                return self.stack.pop()
+            else:
+                # mismatch in nested tags
+                if state.tag:
+                    with disable_exception_traceback():
+                        raise Exception("found </%s> inside \"%s\"-tag>" % (tag, state.tag))
                 else:
-                    # mismatch in nested tags
-                    if state.tag:
-                        with disable_exception_traceback():
-                            raise Exception("found </%s> inside \"%s\"-tag>" % (tag, state.tag))
-                    else:
-                        with disable_exception_traceback():
-                            raise Exception("found mismatched </%s> " % tag)
+                    with disable_exception_traceback():
+                        raise Exception("found mismatched </%s> " % tag)
+
+    def _next_state(self, state, line):
+        """Return the new state if line is a <skip>/<only> tag, otherwise None."""
+        parsed_tag = self.parse_tag(line)
+        if parsed_tag is None:
+            return None
+        return self.apply_tag(state, parsed_tag)
+
+    @filter_properties(markers=['<'], batch_filter='filter_batches')
+    def filter(self, lines):
+        state = self.State(pass_through=True, tag=None)
+        self.stack = []
+        for line in lines:
+            new_state = self._next_state(state, line) if '<' in line else None
+            if new_state is not None:
+                state = new_state
+            elif state.pass_through:
+                yield line
+
+    def filter_batches(self, batches):
+        """SkipOnlyFilter.filter() for batches of lines."""
+        state = self.State(pass_through=True, tag=None)
+        self.stack = []
+        for batch in batches:
+            if state.pass_through and (batch_lacks(batch, ('<',)) or '<' not in ''.join(batch)):
+                # no tags in this batch
+                yield batch
+                continue
+            result = []
+            for line in batch:
+                new_state = self._next_state(state, line) if '<' in line else None
+                if new_state is not None:
+                    state = new_state
+                elif state.pass_through:
+                    result.append(line)
+            yield result
+
+
+class SkipOnlyFanOut(object):
+    """Process <skip> and <only> tags for several targets in one pass."""
+
+    def __init__(self, targets):
+        self.filters = [SkipOnlyFilter(target) for target in targets]
+
+    def split(self, batches):
+        """
+        Return an iterator of batches for each target, with the lines that target includes.
+
+        The branches are lazy: when a branch needs more lines, the next batch
+        of the input is split for all targets, the other branches keep their
+        part until they are read. Read the branches alternately (like
+        FanOutRenderer) to keep only a few batches in memory.
+        """
+        self._batches = iter(batches)
+        self._states = [SkipOnlyFilter.State(pass_through=True, tag=None) for f in self.filters]
+        for f in self.filters:
+            f.stack = []
+        queues = [deque() for f in self.filters]
+        self._queues = queues
+        return [self._branch(queue) for queue in queues]
+
+    def _branch(self, queue):
+        """Yield the batches of one target."""
+        while queue or self._split_next():
+            yield queue.popleft()
+
+    def _split_next(self):
+        """Split the next batch of the input for all targets, return False at the end of the input."""
+        try:
+            batch = next(self._batches)
+        except StopIteration:
+            return False
+        states = self._states
+        if (all(state.pass_through for state in states) and
+                (batch_lacks(batch, ('<',)) or '<' not in ''.join(batch))):
+            # no tags in this batch, all targets get all of it
+            for queue in self._queues:
+                queue.append(batch)
+            return True
+        results = [[] for f in self.filters]
+        for line in batch:
+            parsed_tag = SkipOnlyFilter.parse_tag(line) if '<' in line else None
+            if parsed_tag is None:
+                for state, result in zip(states, results):
+                    if state.pass_through:
+                        result.append(line)
             else:
-                if state.pass_through:
-                    yield line
+                states = [f.apply_tag(state, parsed_tag) for f, state in zip(self.filters, states)]
+        self._states = states
+        for queue, result in zip(self._queues, results):
+            queue.append(result)
+        return True
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""
+A parsed representation of content files, shared by all renders of a file.
+
+Parsing is independent of preset, edition and target format: a source is
+split into lines and blocks (paragraphs), and each block records which of
+the sentinels and markers declared by filters (pipeline.MARKERS) occur in
+it.
+
+A Renderer consumes a ParsedSource as batches of blocks (MarkedBatch),
+so filters can skip blocks that contain nothing for them without scanning
+the text.
+
+Parsed sources and content hashes are kept in memory (the latest version
+of each file), they are not read again as long as size and mtime of the
+file don't change (e.g. when several presets are built in one process, or
+with --watch). prune() forgets files that are no longer part of the build.
+"""
+from __future__ import absolute_import
+
+import hashlib
+from itertools import chain
+import os
+
+from mdbuild.textio import ENCODING
+
+from .metadata import MetadataFilter
+from .pipeline import BATCH_SIZE, MARKERS, MarkedBatch
+
+# (size, mtime, content hash or None, ParsedSource or None) by path, unchanged files are not read again
+_sources = {}
+
+
+class ParsedSource(object):
+    """The lines and blocks of one content file."""
+    __slots__ = ('lines', 'blocks', 'scanned')
+
+    def __init__(self, lines, scanned):
+        self.lines = lines
+        # markers that were searched for
+        self.scanned = scanned
+        # (start, end, markers) for each block
+        self.blocks = []
+        start = 0
+        for idx in range(1, len(lines) + 1):
+            if idx == len(lines) or (lines[idx].strip() and not lines[idx - 1].strip()):
+                # a block ends before each line that follows a blank line
+                text = ''.join(lines[start:idx])
+                self.blocks.append((start, idx, frozenset(m for m in scanned if m in text)))
+                start = idx
+
+    def batches(self, size=BATCH_SIZE):
+        """
+        Yield MarkedBatches of whole blocks with about size lines.
+
+        The first block (with the headline) and blocks with a summary are
+        batches of their own: MetadataFilter changes them, the other
+        batches can pass through unchanged and keep their markers.
+        """
+        start = 0
+        markers = frozenset()
+        separate = False
+        for idx, (block_start, block_end, block_markers) in enumerate(self.blocks):
+            alone = idx == 0 or MetadataFilter.BEGIN_SUMMARY in block_markers
+            if block_start > start and (separate or alone or block_end - start > size):
+                yield MarkedBatch(self.lines[start:block_start], markers, self.scanned)
+                start = block_start
+                markers = frozenset()
+            markers = markers | block_markers
+            separate = alone
+        if start < len(self.lines):
+            yield MarkedBatch(self.lines[start:], markers, self.scanned)
+
+
+class BatchedInput(object):
+    """Input for a Renderer that is already split into batches (e.g. by FanOutRenderer)."""
+    __slots__ = ('_batches',)
+
+    def __init__(self, batches):
+        self._batches = batches
+
+    @property
+    def lines(self):
+        return chain.from_iterable(self._batches)
+
+    def batches(self, size=BATCH_SIZE):
+        return iter(self._batches)
+
+
+def parse_source(lines):
+    """Return a ParsedSource for a list of lines."""
+    return ParsedSource(lines, frozenset(MARKERS))
+
+
+def _memo(path):
+    """Return the stat and memo entry of a file, the entry is None if the file changed."""
+    st = os.stat(path)
+    known = _sources.get(path)
+    if known is not None and known[:2] != (st.st_size, st.st_mtime_ns):
+        known = None
+    return st, known
+
+
+def source_digest(path):
+    """Return the hash of the content of a file (it is only read again if it changed)."""
+    st, known = _memo(path)
+    if known is not None and known[2] is not None:
+        return known[2]
+    with open(path, 'rb') as f:
+        digest = hashlib.sha1(f.read()).hexdigest()
+    _sources[path] = (st.st_size, st.st_mtime_ns, digest, known[3] if known else None)
+    return digest
+
+
+def load_source(path):
+    """Return the ParsedSource of a file, parse it only if it has not been parsed before."""
+    st, known = _memo(path)
+    if known is not None and known[3] is not None and known[3].scanned == MARKERS:
+        return known[3]
+    with open(path, 'rb') as f:
+        parsed = parse_source(f.read().decode(ENCODING).splitlines(True))
+    _sources[path] = (st.st_size, st.st_mtime_ns, known[2] if known else None, parsed)
+    return parsed
+
+
+def prune(paths):
+    """Forget all files except paths (e.g. the content files of the current build)."""
+    paths = set(paths)
+    for path in list(_sources):
+        if path not in paths:
+            del _sources[path]
@@ -2,32 +2,222 @@
 from __future__ import print_function
 from __future__ import absolute_import
 
-import codecs
+from collections import OrderedDict
 from functools import partial
 import logging
 import os
+import sys
 
+from .cache import FileInfoCache, make_salt
 from .common import read_config_file, FILENAME_PATTERN, disable_exception_traceback
+from . import config
 from . import glossary
 from . import macros
-from .renderer import Renderer, filters
+from . import translate
+from .parallel import process_map
+from .renderer import scan_metadata
+from .textio import ENCODING
 
 logger = logging.getLogger(__name__)
 
 # the document structure
 structure = None
 
+# structures by the inputs they were read from (see set_structure), the most recently used last
+_structures = OrderedDict()
+# number of structures that are kept (e.g. for presets with different variables)
+KEPT_STRUCTURES = 4
 
-def set_structure(filename, content_path):
-    logger.info("-- reading structure '%s'" % filename)
 
+def set_structure(filename, content_path, jobs=None, cache_dir=None, only=None):
+    """
+    Read the structure and extract titles, summaries and metadata from all content files.
+
+    If jobs is set, content files are read by that many worker processes.
+    If cache_dir is set, extracted info is cached there and only changed files are read.
+    If only is a list of slugs, the build is restricted to the subtrees of these nodes.
+
+    A structure is kept if it was read from the same files, with the same
+    selection and the same data for expanding macros in titles and
+    summaries (e.g. when the next preset is built).
+    """
     macros.register_macro('glossary', glossary.glossary_term_macro)
     macros.register_macro('define', glossary.glossary_definition_macro)
 
+    read_from = (filename, content_path, tuple(only or ()), info_salt())
+    cs = _structures.get(read_from)
+    if cs is not None:
+        logger.info("-- keeping structure '%s'" % filename)
+        _structures.move_to_end(read_from)
+        globals()['structure'] = cs
+        return
+    logger.info("-- reading structure '%s'" % filename)
+
     cs = ContentRoot.from_config(read_config_file(filename))
-    cs.read_info(content_path)
+    if cache_dir:
+        cache = get_info_cache(cache_dir)
+    else:
+        cache = None
+    cs.read_info(content_path, jobs=jobs, cache=cache, only=only)
+    if cache:
+        cache.save()
     # logger.debug(cs.to_dict())
     globals()['structure'] = cs
+    _structures[read_from] = cs
+    while len(_structures) > KEPT_STRUCTURES:
+        _structures.popitem(last=False)
+
+
+def clear_structure():
+    """Forget all structures."""
+    globals()['structure'] = None
+    _structures.clear()
+
+
+def files_changed(paths):
+    """
+    Forget structures that were read from one of paths (absolute paths),
+    and the info of nodes whose content file is one of paths (it is read
+    again when it is needed).
+    """
+    for read_from, cs in list(_structures.items()):
+        filename, content_path = read_from[:2]
+        if os.path.abspath(filename) in paths or not cs.forget_info(paths):
+            del _structures[read_from]
+            if cs is structure:
+                globals()['structure'] = None
+
+
+def info_salt():
+    """
+    Return a digest of the data that titles and summaries depend on.
+
+    Macros are expanded in titles and summaries, so they depend on the set
+    of registered macros, the glossary, the translation memory and the
+    config variables.
+    """
+    variables = getattr(config.cfg, 'variables', None)
+    return make_salt(macros.registered_macros(), glossary.glossary,
+                     sorted(translate.translation_memory.items()),
+                     vars(variables) if variables is not None else None)
+
+
+def get_info_cache(cache_dir):
+    """
+    Return the cache for node info of the current preset.
+
+    The cache is invalidated when the info_salt() changes.
+    """
+    preset = getattr(config.cfg, 'preset', None)
+    return FileInfoCache(os.path.join(cache_dir, 'info-%s.pickle' % preset), info_salt())
+
+
+def read_node_info(source_path):
+    """
+    Return (title, summary, metadata) extracted from a content file.
+
+    Only the beginning of the file is read (up to the end of the summary).
+    Content files are parsed for rendering only when they are rendered
+    (see renderer.source), so that reading the structure stays cheap for
+    long files, and parsed sources are kept by the process that renders.
+    """
+    with open(source_path, 'r', encoding=ENCODING, newline='') as source:
+        return scan_metadata(source, expand=partial(macros.MacroFilter.expand, ignore_unknown=True))
+
+
+class DirectoryListing(object):
+    """
+    Check if files exist by listing each directory only once.
+
+    Names are compared case-sensitively, a case-insensitive match is confirmed
+    with the file system (which might be case-insensitive, e.g. on macOS).
+    """
+
+    def __init__(self):
+        self.listings = {}
+
+    def _list(self, directory):
+        try:
+            with os.scandir(directory or os.curdir) as entries:
+                names = frozenset(entry.name for entry in entries)
+        except (FileNotFoundError, NotADirectoryError):
+            names = frozenset()
+        self.listings[directory] = (names, frozenset(name.lower() for name in names))
+        return self.listings[directory]
+
+    def exists(self, path):
+        directory, name = os.path.split(path)
+        try:
+            names, lower_names = self.listings[directory]
+        except KeyError:
+            names, lower_names = self._list(directory)
+        if name in names:
+            return True
+        return name.lower() in lower_names and os.path.exists(path)
+
+
+class TagIndex(object):
+    """
+    Select nodes by tags.
+
+    For each tag, the index holds a bitset (an int) of the positions in
+    the reading order of all nodes with that tag, so that tag expressions
+    can be evaluated with set operations:
+
+    - pattern: all nodes tagged 'pattern'
+    - pattern+governance: nodes tagged 'pattern' and 'governance'
+    - pattern|governance: nodes tagged 'pattern' or 'governance'
+    - -draft: all nodes not tagged 'draft'
+
+    '+' binds closer than '|', so 'a+b|c' means '(a and b) or c'.
+    """
+
+    def __init__(self, reading_order):
+        self.reading_order = reading_order
+        self.all = (1 << len(reading_order)) - 1
+        positions = {}
+        for position, node in enumerate(reading_order):
+            for tag in node.tags:
+                positions.setdefault(tag, []).append(position)
+        self.bitsets = dict((tag, sum(1 << p for p in p_list)) for tag, p_list in positions.items())
+        self._expressions = {}
+
+    def evaluate(self, expression):
+        """Return the bitset of all nodes that match a tag expression."""
+        try:
+            return self._expressions[expression]
+        except KeyError:
+            pass
+        result = 0
+        for term in expression.split('|'):
+            bits = self.all
+            for tag in term.split('+'):
+                tag = tag.strip()
+                if tag.startswith('-'):
+                    bits &= ~self.bitsets.get(tag[1:], 0)
+                else:
+                    bits &= self.bitsets.get(tag, 0)
+            result |= bits
+        self._expressions[expression] = result
+        return result
+
+    def select(self, expressions, within=None):
+        """
+        Return all nodes (in reading order) that match all tag expressions.
+
+        If within is a node, only that node and its descendants are selected.
+        """
+        bits = self.all
+        for expression in expressions:
+            bits &= self.evaluate(expression)
+        if within is not None and not within.is_root():
+            bits &= ((1 << (within._end + 1)) - 1) ^ ((1 << within._position) - 1)
+        nodes = []
+        while bits:
+            lowest = bits & -bits
+            nodes.append(self.reading_order[lowest.bit_length() - 1])
+            bits ^= lowest
+        return nodes
 
 
 class ContentNode(object):
@@ -42,48 +232,83 @@ class ContentNode(object):
     - title extracted from file
     - parameters (extracted from structure yaml)
     - tags (part of parameters??)
+
+    Structures can have tens of thousands of nodes, so nodes use slots,
+    and id, path and relpath are computed only once.
     """
+    __slots__ = ('slug', 'parent', 'root', 'level', 'parts', 'nav_title', 'config', 'tags',
+                 '_info', '_position', '_end', '_id', '_path', '_relpath', '_source_path', '_view')
 
     def __init__(self, slug, parent, root, level):
-        pass
+        if isinstance(slug, str):
+            slug = sys.intern(slug)
         self.slug = slug
         self.parent = parent
         self.root = root
         self.level = level
-        self.parts = []
-        self.title = ''
+        self.parts = ()
         self.nav_title = ''
-        self.config = {}
-        self.tags = []
-        self.summary = ''
-        self.metadata = {}
+        self.config = None
+        self.tags = ()
+        # (title, summary, metadata), None if it needs to be read from the content file
+        self._info = ('', '', {})
+        # position of the node and its last descendant in root.reading_order (set by ContentRoot.update_index)
+        self._position = None
+        self._end = None
+        self._id = None
+        self._path = None
+        self._relpath = None
+        self._source_path = None
+        self._view = None
 
     def is_root(self):
         return self is self.root
 
     @property
     def id(self):
-        return '.'.join((self.parent.id, self.slug))
+        if self._id is None:
+            self._id = '.'.join((self.parent.id, self.slug))
+        return self._id
 
     @property
     def path(self):
-        return os.path.join(self.parent.path, self.slug)
+        if self._path is None:
+            self._path = os.path.join(self.parent.path, self.slug)
+        return self._path
 
     @property
     def relpath(self):
-        return os.path.join(self.parent.relpath, self.slug)
+        if self._relpath is None:
+            self._relpath = os.path.join(self.parent.relpath, self.slug)
+        return self._relpath
 
     @property
     def source_path(self):
         """
         Return the actual source path for the content file.
 
+        Source paths are usually resolved for all nodes by
+        ContentRoot.resolve_source_paths().
+        """
+        if self._source_path is None:
+            source_path = self.resolve_source_path(DirectoryListing())
+            if source_path is None:
+                with disable_exception_traceback():
+                    raise Exception('Source file "%s" not found' % self.md_filename(self.path))
+            self._source_path = source_path
+        return self._source_path
+
+    def resolve_source_path(self, listing):
+        """
+        Return the first existing candidate for the content file (or None):
+
         - <path>.md
         - <path>/index.md
         - <path>/<slug>.md
+        - <path>/<slug>_index.md
         """
         source_path = self.md_filename(self.path)
-        if os.path.exists(source_path):
+        if listing.exists(source_path):
             return source_path
         elif self.parts:
             for source_path in [
@@ -91,26 +316,17 @@ class ContentNode(object):
                 self.md_filename(os.path.join(self.path, self.slug)),
                 self.md_filename(os.path.join(self.path, '_'.join((self.slug, 'index'))))
             ]:
-                if os.path.exists(source_path):
+                if listing.exists(source_path):
                     return source_path
-            with disable_exception_traceback():
-                raise Exception('Source file "%s" not found' % source_path)
-        else:
-            with disable_exception_traceback():
-                raise Exception('Source file "%s" not found' % source_path)
-
-        return source_path
+        return None
 
     @property
     def last_descendant(self):
         """
-        Return the last descendant of the current node  (recursive).
+        Return the last descendant of the current node.
         If the current node has no parts, it's its own last descendant
         """
-        if self.parts:
-            return self.parts[-1].last_descendant
-        else:
-            return self
+        return self.root.reading_order[self._end]
 
     @property
     def predecessor(self):
@@ -119,26 +335,18 @@ class ContentNode(object):
         - the last descendant of previous sibling (which might be the previous sibling itself)
         - the parent, or None.
         """
-        idx = self.parent.parts.index(self)
-        if idx:  # there is a previous sibling
-            return self.parent.parts[idx - 1].last_descendant
-        elif not self.parent.is_root():
-            return self.parent
+        if self._position:
+            return self.root.reading_order[self._position - 1]
         else:
             return None
 
     @property
     def next_sibling_or_ancestor_sibling(self):
-        """If the node has next sibling:
         """
-        idx = self.parent.parts.index(self)
-        if idx + 1 < len(self.parent.parts):
-            # there is a next sibling
-            return self.parent.parts[idx + 1]
-        elif not self.parent.is_root():
-            return self.parent.next_sibling_or_ancestor_sibling
-        else:
-            return None
+        Return the next sibling, or the next sibling of the closest ancestor
+        that has one (which might be None).
+        """
+        return self.root.node_at(self._end + 1)
 
     @property
     def successor(self):
@@ -148,14 +356,34 @@ class ContentNode(object):
         - the next sibling, or the next sibling of the closest ancestor,
           (which might be None)
         """
-        if self.parts:
-            return self.parts[0]
-        else:
-            return self.next_sibling_or_ancestor_sibling
+        return self.root.node_at(self._position + 1)
 
     def md_filename(self, fn):
         return FILENAME_PATTERN % fn
 
+    @property
+    def view(self):
+        """
+        Return a flat dictionary of the node's data for rendering templates (e.g. in macros).
+
+        Unlike to_dict() this does not include descendants, and it is computed only once.
+        Tags and config have the types of the structure file (a list and a dict),
+        no matter how the node stores them.
+        """
+        if self._view is None:
+            self._view = {
+                'id': self.id,
+                'slug': self.slug,
+                'title': self.title,
+                'menu_title': self.metadata.get('menu-title', self.title),
+                'summary': self.summary,
+                'path': self.path,
+                'tags': list(self.tags),
+                'config': self.config or {},
+                'metadata': self.metadata,
+            }
+        return self._view
+
     def to_dict(self):
         d = {
             'id': self.id,
@@ -168,7 +396,7 @@ class ContentNode(object):
         if self.parts:
             d['parts'] = [p.to_dict() for p in self.parts]
         if self.tags:
-            d['tags'] = self.tags
+            d['tags'] = list(self.tags)
         if self.config:
             d['config'] = repr(self.config)
         if self.metadata:
@@ -182,11 +410,11 @@ class ContentNode(object):
         if data.__class__ == dict:
             item = cls(data['id'], parent, root, level)
             if 'tags' in data:
-                item.tags = data['tags']
+                item.tags = tuple(sys.intern(tag) for tag in data['tags'])
             if 'config' in data:
                 item.config = data['config']
             if 'parts' in data:
-                item.parts = [ContentNode.from_config(part, item, parent, level + 1) for part in data['parts']]
+                item.parts = [ContentNode.from_config(part, item, root, level + 1) for part in data['parts']]
         else:
             item = cls(data, parent, root, level)
 
@@ -201,29 +429,59 @@ class ContentNode(object):
 
     def _read_info(self):
         """Extract titles, summaries and medatada from a node's content."""
-        if not os.path.exists(self.source_path):
-            raise Exception("ERROR: source_path %s doesn't exist)" % self.path)
-        with codecs.open(self.source_path, 'r', 'utf-8') as source:
-            renderer = Renderer(source, filters=[
-                partial(macros.MacroFilter.filter, ignore_unknown=True),
-                filters.MetadataFilter.filter,
-            ])
-            renderer.render()
-            logger.debug("node title: '%s'" % filters.MetadataFilter.title)
-            self.title = filters.MetadataFilter.title
-            self.summary = filters.MetadataFilter.summary
-            self.metadata = filters.MetadataFilter.metadata
+        self.set_info(read_node_info(self.source_path))
+
+    def set_info(self, info):
+        """Set title, summary and metadata from the result of read_node_info()."""
+        self._info = tuple(info)
+        self._view = None
+        logger.debug("node title: '%s'" % self.title)
+
+    @property
+    def info(self):
+        """Return (title, summary, metadata), read the content file first if necessary."""
+        if self._info is None:
+            self._read_info()
+        return self._info
+
+    @property
+    def title(self):
+        return self.info[0]
+
+    @title.setter
+    def title(self, title):
+        self.set_info((title,) + self.info[1:])
+
+    @property
+    def summary(self):
+        return self.info[1]
+
+    @summary.setter
+    def summary(self, summary):
+        title, _, metadata = self.info
+        self.set_info((title, summary, metadata))
+
+    @property
+    def metadata(self):
+        return self.info[2]
+
+    @metadata.setter
+    def metadata(self, metadata):
+        self.set_info(self.info[:2] + (metadata,))
+
+    def walk(self):
+        """Yield this node and all its descendants in reading order."""
+        yield self
+        for part in self.parts:
+            for node in part.walk():
+                yield node
 
     def find(self, slug):
         """Find slug in this subtree"""
-        if self.slug == slug:
-            return self
-        for part in self.parts:
-            res = part.find(slug)
-            if res:
-                return res
-        else:
-            return None
+        for node in self.root.slug_index.get(slug, ()):
+            if self._position <= node._position <= self._end:
+                return node
+        return None
 
 
 class ContentRoot(ContentNode):
@@ -233,29 +491,191 @@ class ContentRoot(ContentNode):
     Content is split into parts, which can havbe parts again, ad infinitum (in practcie, there's only a limited number
     of header levels in most output formats).
     """
+    __slots__ = ('_root_path', 'reading_order', 'slug_index', 'tag_index', 'selection')
+
     def __init__(self, root_path):
-        self.root_path = root_path
         super(ContentRoot, self).__init__(None, None, self, 0)
+        self._root_path = root_path
+        # all nodes in reading order, a list of nodes per slug, and the tags (see update_index)
+        self.reading_order = []
+        self.slug_index = {}
+        self.tag_index = TagIndex([])
+        # nodes whose subtrees are built (see select), None for all nodes
+        self.selection = None
+
+    @property
+    def root_path(self):
+        return self._root_path
+
+    @root_path.setter
+    def root_path(self, root_path):
+        if root_path != self._root_path:
+            # paths of all nodes are derived from the root path
+            for node in self.walk():
+                node._path = None
+                node._source_path = None
+                node._view = None
+        self._root_path = root_path
 
     @classmethod
     def from_config(cls, structure, path=None):
         c = cls(path)
-        c.root_path = path
         c.config = structure['config']
         c.parts = [ContentNode.from_config(part, c, c, 1) for part in structure['parts']]
+        c.update_index()
         return c
 
+    def update_index(self):
+        """
+        Build the reading order, the slug index and the tag index for navigating the structure.
+
+        Must be called after changing the parts of any node in the structure.
+        """
+        reading_order = list(self.walk())
+        slug_index = {}
+        for position, node in enumerate(reading_order):
+            node._position = position
+            slug_index.setdefault(node.slug, []).append(node)
+        # the subtree of a node ends with the last descendant of its last part
+        for node in reversed(reading_order):
+            if node.parts:
+                node._end = node.parts[-1]._end
+            else:
+                node._end = node._position
+        self.reading_order = reading_order
+        self.slug_index = slug_index
+        self.tag_index = TagIndex(reading_order)
+
+    def node_at(self, position):
+        """Return the node at position in the reading order, or None."""
+        if position < len(self.reading_order):
+            return self.reading_order[position]
+        else:
+            return None
+
+    def find(self, slug):
+        """Find slug in the whole structure."""
+        if self.slug == slug:
+            return self
+        nodes = self.slug_index.get(slug)
+        if nodes:
+            return nodes[0]
+        else:
+            return None
+
+    def select(self, slugs):
+        """Restrict the build to the subtrees of the nodes with these slugs."""
+        selection = []
+        for slug in slugs:
+            node = self.find(slug)
+            if node is None:
+                with disable_exception_traceback():
+                    raise Exception("can't select unknown node '%s'" % slug)
+            selection.append(node)
+        self.selection = selection
+
+    def selected_nodes(self):
+        """Return the nodes of the selected subtrees (or all nodes) in reading order."""
+        if self.selection is None:
+            return self.reading_order
+        positions = set()
+        for node in self.selection:
+            positions.update(range(node._position, node._end + 1))
+        return [self.reading_order[position] for position in sorted(positions)]
+
     def to_dict(self):
         return {
             'config': self.config,
             'parts': [p.to_dict() for p in self.parts],
         }
 
-    def read_info(self, content_path):
-        """Read titles and structure etc. from content files."""
+    def read_info(self, content_path, jobs=None, cache=None, only=None):
+        """
+        Read titles and structure etc. from content files.
+
+        With jobs > 1 the files are read in a pool of worker processes, results
+        are assigned to the nodes in structure order.
+
+        If a cache is passed, only files without a valid cache entry are read.
+
+        If only is a list of slugs, only the selected subtrees and their
+        neighbours in the reading order (for page navigation) are read, info
+        for all other nodes is read when it is first accessed (e.g. by a macro).
+        """
         self.root_path = content_path
+        self.resolve_source_paths()
+        if only:
+            self.select(only)
+            required = set()
+            for node in self.selected_nodes():
+                required.update((node.predecessor, node, node.successor))
+        else:
+            required = None
+
+        nodes_to_read = []
+        source_paths = []
+        for node in self.walk():
+            source_path = node.source_path
+            info = cache.get(source_path) if cache is not None else None
+            if info is not None:
+                node.set_info(info)
+            elif required is None or node in required:
+                nodes_to_read.append(node)
+                source_paths.append(source_path)
+            else:
+                # read on demand
+                node._info = None
+        logger.info("reading %s content files" % len(nodes_to_read))
+        for node, source_path, info in zip(nodes_to_read, source_paths,
+                                           process_map(read_node_info, source_paths, jobs)):
+            node.set_info(info)
+            if cache is not None:
+                cache.set(source_path, info)
+
+    def forget_info(self, paths):
+        """
+        Forget the info of all nodes whose content file is one of paths
+        (absolute paths), it is read again when it is needed.
+
+        Return False if the source path of any node changed (e.g. a file
+        was added or removed), then the structure must be read again.
+        """
+        root = os.path.abspath(self.root_path) + os.sep
+        if not any(path.startswith(root) for path in paths):
+            return True
+        listing = DirectoryListing()
+        for node in self.walk():
+            source_path = node.resolve_source_path(listing)
+            if source_path != node._source_path:
+                return False
+            if os.path.abspath(source_path) in paths:
+                node._info = None
+                node._view = None
+        return True
+
+    def resolve_source_paths(self):
+        """
+        Resolve the source paths of all nodes, listing each content directory only once.
+
+        Raises an exception that lists all missing source files.
+        """
+        listing = DirectoryListing()
+        missing = []
+        for node in self.walk():
+            node._source_path = node.resolve_source_path(listing)
+            if node._source_path is None:
+                missing.append(node.md_filename(node.path))
+        if missing:
+            for source_path in missing:
+                logger.error('Source file "%s" not found' % source_path)
+            with disable_exception_traceback():
+                raise Exception('%s source files not found: %s' % (len(missing), ', '.join(missing)))
+
+    def walk(self):
+        """Yield all nodes in reading order (the root itself is not included)."""
         for part in self.parts:
-            part.read_info()
+            for node in part.walk():
+                yield node
 
     @property
     def id(self):
@@ -269,6 +689,13 @@ class ContentRoot(ContentNode):
     def relpath(self):
         return ''
 
+    @property
+    def last_descendant(self):
+        if self.reading_order:
+            return self.reading_order[-1]
+        else:
+            return self
+
     @property
     def predecessor(self):
         return None
@@ -3,22 +3,31 @@
 
 from __future__ import absolute_import
 
-import codecs
 from functools import partial
 import logging
+import os
 import shutil
 import sys
 
 from . import config
+from . import dependencies
 from . import glossary
 from . import macros
+from . import textio
+from .cache import file_digest
 from .renderer import Renderer, filters
+from .textio import OutputFile, read_lines, write_if_changed
 
 logger = logging.getLogger(__name__)
 
 
-def process_templates_in_config():
-    """Process all templated defined in config.templates."""
+def process_templates_in_config(manifest=None):
+    """
+    Process all templated defined in config.templates.
+
+    If a manifest is given (see dependencies.Manifest), templates are only
+    processed if their source or the data they use changed.
+    """
     try:
         config.cfg.templates
     except AttributeError:
@@ -40,7 +49,19 @@ def process_templates_in_config():
         except AttributeError:
             logger.error("no destination for template '%s'" % t.source)
             sys.exit(1)
-        template(mode, source, destination)
+        if manifest is None:
+            template(mode, source, destination)
+            continue
+        if mode == 'copy' and os.path.isdir(destination):
+            destination = os.path.join(destination, os.path.basename(source))
+        input_digest = dependencies.digest(mode, file_digest(source))
+        if manifest.is_current(destination, input_digest):
+            logger.info("template is up to date: '%s'" % destination)
+            textio.output_stats['unchanged'] += 1
+            continue
+        with dependencies.recording() as recorded:
+            template(mode, source, destination)
+        manifest.update(destination, input_digest, recorded)
 
 
 def template(mode, source, destination):
@@ -49,10 +70,16 @@ def template(mode, source, destination):
     - default: substitute variables and translations
     - copy: simply copy, don't touch
     - markdown: full markdown processing (inkl. jekyll front matter and macros)
+
+    The destination is only written if its content changes.
     """
     logger.info("processing template: mode='%s', source='%s', destination='%s'" % (mode, source, destination))
     if mode == 'copy':
-        shutil.copy(source, destination)
+        if os.path.isdir(destination):
+            destination = os.path.join(destination, os.path.basename(source))
+        with open(source, 'rb') as f:
+            if write_if_changed(destination, f.read()):
+                shutil.copymode(source, destination)
     elif mode in ['html', 'markdown']:
         _processed_template(mode, source, destination)
     elif mode == 'default':
@@ -68,30 +95,33 @@ def _processed_template(mode, src, dest):
     html templates.
     """
 
-    with codecs.open(src, 'r', 'utf-8') as source:
-        with codecs.open(dest, 'w+', 'utf-8') as target:
-            renderer = Renderer(source, filters=[
-                filters.SkipOnlyFilter.filter,
-                filters.inject_variables_and_translations,
-                partial(filters.convert_section_links, 'html'),
-                partial(macros.MacroFilter.filter),
-                filters.unescape_macros,
-                # TODO: this is not always the right thing, but glossary entries in templates are pretty rare
-                glossary.get_glossary_link_processor('tooltip'),
-            ])
-            if mode == 'markdown':
-                renderer.add_filter(partial(filters.jekyll_front_matter, None))
-            renderer.add_filter(partial(filters.write, target))
-            renderer.render()
+    with OutputFile(dest) as target:
+        renderer = Renderer(read_lines(src), name=src, filters=[
+            filters.SkipOnlyFilter().filter,
+            filters.inject_variables_and_translations,
+            partial(filters.convert_section_links, 'html'),
+            partial(macros.MacroFilter.filter),
+            filters.unescape_macros,
+            # TODO: this is not always the right thing, but glossary entries in templates are pretty rare
+            glossary.get_glossary_link_processor('tooltip'),
+        ])
+        if mode == 'markdown':
+            renderer.add_filter(partial(filters.jekyll_front_matter, None))
+        renderer.add_filter(partial(filters.write, target))
+        renderer.render()
 
 
 def _default_template(src, dest):
     """Substitute variables and translations."""
 
-    with codecs.open(src, 'r', 'utf-8') as source:
-        with codecs.open(dest, 'w+', 'utf-8') as target:
-            renderer = Renderer(source, filters=[
-                filters.inject_variables_and_translations,
-                partial(filters.write, target),
-            ])
-            renderer.render()
+    with OutputFile(dest) as target:
+        render_default_template(src, target)
+
+
+def render_default_template(src, target):
+    """Substitute variables and translations, write the result to target (an open file)."""
+    renderer = Renderer(read_lines(src), name=src, filters=[
+        filters.inject_variables_and_translations,
+        partial(filters.write, target),
+    ])
+    renderer.render()
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+Buffered text I/O for builders, templates and tools.
+
+All text files are UTF-8. Newlines are never translated:
+
+- read_lines() splits the content of a file into lines (like iterating
+  over a codecs stream), each line keeps its original line ending,
+- TextWriter and OutputFile write text exactly as it is given.
+
+Files are read with one call, output is collected in memory and written in
+large chunks.
+
+OutputFile (for build results) leaves the target untouched if its content
+would not change, so that mtimes only change for files that actually
+changed. The number of changed and unchanged files is tracked in
+output_stats.
+
+Usage:
+
+with OutputFile(target_path) as target:
+    for line in read_lines(source_path):
+        target.write(line)
+"""
+from __future__ import absolute_import
+
+import hashlib
+import os
+import shutil
+
+from .cache import file_digest
+
+ENCODING = 'utf-8'
+
+# flush output when this many characters are buffered
+BUFFER_SIZE = 1 << 20
+
+# number of files written (or left alone) by write_if_changed()
+output_stats = {'changed': 0, 'unchanged': 0}
+
+
+def read_text(path):
+    """Return the content of a text file."""
+    with open(path, 'rb') as f:
+        return f.read().decode(ENCODING)
+
+
+def read_lines(path):
+    """Return the lines of a text file (with line endings)."""
+    return read_text(path).splitlines(True)
+
+
+class TextWriter(object):
+    """A text file for output, that collects writes and flushes them in large chunks."""
+
+    def __init__(self, path, append=False, buffer_size=BUFFER_SIZE):
+        self.path = path
+        self.buffer_size = buffer_size
+        self._file = open(path, 'ab' if append else 'wb')
+        self._parts = []
+        self._size = 0
+
+    def write(self, text):
+        self._parts.append(text)
+        self._size += len(text)
+        if self._size >= self.buffer_size:
+            self.flush()
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def flush(self):
+        """Write all buffered text to the file."""
+        if self._parts:
+            self._file.write(''.join(self._parts).encode(ENCODING))
+            self._parts = []
+            self._size = 0
+        self._file.flush()
+
+    def close(self):
+        if self._file.closed:
+            return
+        try:
+            self.flush()
+        finally:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def write_if_changed(path, data):
+    """
+    Replace the file at path with data (bytes), unless it already has this content.
+
+    The file is replaced atomically and keeps its permissions.
+    Return True if the file was written.
+    """
+    try:
+        unchanged = (os.path.getsize(path) == len(data) and
+                     file_digest(path) == hashlib.sha1(data).hexdigest())
+    except OSError:
+        # no file (or not readable), write it
+        unchanged = False
+    if unchanged:
+        output_stats['unchanged'] += 1
+        return False
+    tmp_path = '%s.%s.tmp' % (path, os.getpid())
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    if os.path.exists(path):
+        shutil.copymode(path, tmp_path)
+    os.replace(tmp_path, path)
+    output_stats['changed'] += 1
+    return True
+
+
+def output_summary():
+    return 'output: %(changed)s files changed, %(unchanged)s unchanged' % output_stats
+
+
+class OutputFile(object):
+    """
+    Text output that is collected in memory, and written to path
+    with write_if_changed() when the file is closed.
+
+    Nothing is written if the with block is left with an exception.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.changed = None
+        self._parts = []
+
+    def write(self, text):
+        self._parts.append(text)
+
+    def writelines(self, lines):
+        self._parts.extend(lines)
+
+    def close(self):
+        if self._parts is None:
+            return
+        data = ''.join(self._parts).encode(ENCODING)
+        self._parts = None
+        self.changed = write_if_changed(self.path, data)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self._parts = None
@@ -9,15 +9,24 @@ import logging
 import os.path
 import polib
 
+from . import dependencies
+
 logger = logging.getLogger(__name__)
 
 translation_memory = {}
 
+# the file the current translation memory was read from
+_read_from = None
+
 
 def read_translation_memory(filename):
-    """Read translation memory from a po-file."""
+    """Read translation memory from a po-file (unless it was already read from that file)."""
+    if filename == _read_from:
+        return
     if not os.path.exists(filename):
         logger.warning("translation memory not found: '%s'", filename)
+        globals()["translation_memory"] = {}
+        globals()["_read_from"] = filename
         return
     tm = {}
     po = polib.pofile(filename)
@@ -25,9 +34,18 @@ def read_translation_memory(filename):
         if not entry.obsolete:
             tm[entry.msgid] = entry.msgstr
     globals()["translation_memory"] = tm
+    globals()["_read_from"] = filename
+
+
+def files_changed(paths):
+    """Forget the translation memory if it was read from one of paths (absolute paths)."""
+    if _read_from and os.path.abspath(_read_from) in paths:
+        globals()["translation_memory"] = {}
+        globals()["_read_from"] = None
 
 
 def translate(message, warnings=None):
+    dependencies.record('translation', message)
     if message in translation_memory:
         return translation_memory[message]
     else:
@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+"""
+Watch the inputs of a build (content, config, templates, translations) for changes.
+
+On Linux, changes are reported by inotify (through libc, no extra package
+is needed), elsewhere the files are polled. Bursts of changes (e.g. an
+editor saving through a temporary file) are collected into one
+notification (debouncing).
+
+Hidden files (e.g. editor swap files), temporary and backup files are
+ignored.
+
+Usage:
+
+watcher = get_watcher()
+watcher.watch(files, directories)
+while True:
+    changed = watcher.wait()
+    rebuild()
+"""
+from __future__ import absolute_import
+
+import abc
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import select
+import struct
+import time
+
+logger = logging.getLogger(__name__)
+
+# seconds without further changes before wait() returns
+DEBOUNCE = 0.1
+# seconds between scans of PollingWatcher
+POLL_INTERVAL = 0.5
+
+
+def is_ignored(path):
+    """Return True for files that never trigger a rebuild."""
+    name = os.path.basename(path)
+    return name.startswith('.') or name.endswith('~') or name.endswith('.tmp')
+
+
+def is_input(path, files, directories):
+    """Return True if path is one of files, or in one of directories (and not ignored)."""
+    if is_ignored(path):
+        return False
+    if path in files:
+        return True
+    for directory in directories:
+        if path == directory or path.startswith(directory + os.sep):
+            return True
+    return False
+
+
+class Watcher(abc.ABC):
+    """
+    Base class for watchers: watch files, and directories with all their
+    files and subdirectories.
+    """
+
+    def __init__(self, debounce=DEBOUNCE):
+        self.debounce = debounce
+        self.files = set()
+        self.directories = set()
+
+    def watch(self, files, directories):
+        """Set the watched files and directories (replaces the previous ones)."""
+        self.files = set(os.path.abspath(f) for f in files)
+        self.directories = set(os.path.abspath(d) for d in directories)
+
+    def is_watched(self, path):
+        return is_input(path, self.files, self.directories)
+
+    def walk(self):
+        """Yield all watched directories and their subdirectories."""
+        for directory in self.directories:
+            for root, dirs, files in os.walk(directory):
+                dirs[:] = [d for d in dirs if not is_ignored(d)]
+                yield root
+
+    def wait(self, timeout=None):
+        """
+        Return the set of changed paths, after the first change and
+        debounce seconds without further changes.
+
+        Return an empty set if nothing changed within timeout seconds.
+        """
+        changed = self.changes(timeout)
+        while changed:
+            more = self.changes(self.debounce)
+            if not more:
+                break
+            changed |= more
+        return changed
+
+    @abc.abstractmethod
+    def changes(self, timeout):
+        """Return the changed paths, wait up to timeout seconds for a change."""
+
+    def close(self):
+        pass
+
+
+class PollingWatcher(Watcher):
+    """Find changes by comparing size and mtime of all files."""
+
+    def __init__(self, debounce=DEBOUNCE, interval=POLL_INTERVAL):
+        super(PollingWatcher, self).__init__(debounce)
+        self.interval = interval
+        self.snapshot = {}
+
+    def watch(self, files, directories):
+        super(PollingWatcher, self).watch(files, directories)
+        self.snapshot = self.scan()
+
+    def scan(self):
+        """Return (size, mtime) of all watched files by path."""
+        snapshot = {}
+        paths = list(self.files)
+        for directory in self.walk():
+            paths.extend(os.path.join(directory, name) for name in os.listdir(directory))
+        for path in paths:
+            if is_ignored(path):
+                continue
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            snapshot[path] = (st.st_size, st.st_mtime_ns)
+        return snapshot
+
+    def changes(self, timeout):
+        end = None if timeout is None else time.monotonic() + timeout
+        while True:
+            snapshot = self.scan()
+            changed = set(path for path in set(snapshot) | set(self.snapshot)
+                          if snapshot.get(path) != self.snapshot.get(path))
+            self.snapshot = snapshot
+            if changed:
+                return changed
+            if end is not None and time.monotonic() >= end:
+                return set()
+            delay = self.interval if end is None else min(self.interval, max(0, end - time.monotonic()))
+            time.sleep(delay)
+
+
+class InotifyWatcher(Watcher):
+    """Get changes from inotify (Linux)."""
+
+    IN_MODIFY = 0x2
+    IN_ATTRIB = 0x4
+    IN_CLOSE_WRITE = 0x8
+    IN_MOVED_FROM = 0x40
+    IN_MOVED_TO = 0x80
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+    IN_Q_OVERFLOW = 0x4000
+    IN_IGNORED = 0x8000
+    IN_ISDIR = 0x40000000
+    MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+    EVENT = struct.Struct('iIII')
+
+    def __init__(self, debounce=DEBOUNCE):
+        super(InotifyWatcher, self).__init__(debounce)
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | getattr(os, 'O_CLOEXEC', 0))
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        # watched directory by watch descriptor
+        self.watches = {}
+
+    def watch(self, files, directories):
+        super(InotifyWatcher, self).watch(files, directories)
+        for directory in set(os.path.dirname(f) for f in self.files) | set(self.walk()):
+            self._add_watch(directory)
+
+    def _add_watch(self, directory):
+        if directory in self.watches.values():
+            return
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), self.MASK)
+        if wd < 0:
+            logger.warning("can't watch '%s': %s" % (directory, os.strerror(ctypes.get_errno())))
+        else:
+            self.watches[wd] = directory
+
+    def changes(self, timeout):
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set()
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except OSError as e:
+            if e.errno == errno.EAGAIN:
+                return set()
+            raise
+        changed = set()
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = self.EVENT.unpack_from(data, offset)
+            name = data[offset + self.EVENT.size:offset + self.EVENT.size + length].rstrip(b'\0')
+            offset += self.EVENT.size + length
+            if mask & self.IN_Q_OVERFLOW:
+                # events were lost, assume everything changed
+                changed.update(self.files | self.directories)
+                continue
+            if mask & self.IN_IGNORED:
+                self.watches.pop(wd, None)
+                continue
+            directory = self.watches.get(wd)
+            if directory is None:
+                continue
+            path = os.path.join(directory, os.fsdecode(name)) if name else directory
+            if not self.is_watched(path):
+                continue
+            if mask & self.IN_ISDIR and mask & (self.IN_CREATE | self.IN_MOVED_TO):
+                # a new directory in a watched tree
+                for root, dirs, files in os.walk(path):
+                    self._add_watch(root)
+            changed.add(path)
+        return changed
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+def get_watcher(debounce=DEBOUNCE):
+    """Return an InotifyWatcher if inotify is available, otherwise a PollingWatcher."""
+    try:
+        return InotifyWatcher(debounce)
+    except (AttributeError, OSError) as e:
+        logger.info("inotify is not available (%s), polling for changes" % e)
+        return PollingWatcher(debounce)
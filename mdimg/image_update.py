@@ -18,6 +18,8 @@ import shutil
 import sys
 
 
+from mdbuild.textio import TextWriter, read_lines
+
 from .common import filter_dirs, DOCUMENT_TYPES
 from .image_repo import ImageRepo
 
@@ -97,9 +99,8 @@ class Document(object):
             original = self.path
             print('original', original)
             print('target', target_path)
-            with open(original, 'r') as source:
-                with open(target_path, 'w+') as target:
-                    self.parse_file(source, target.write)
+            with TextWriter(target_path) as target:
+                self.parse_file(read_lines(original), target.write)
 
             if self.keep_backup:
                 shutil.move(original, self.path + '.backup')
@@ -113,23 +114,17 @@ class Document(object):
             else:
                 shutil.move(target_path, self.path)
         else:
-            with file(self.path, 'r') as source:
-                def ignore(s):
-                    pass
-                self.parse_file(source, ignore)
+            def ignore(s):
+                pass
+            self.parse_file(read_lines(self.path), ignore)
 
-    def parse_file(self, source, writer):
+    def parse_file(self, lines, writer):
         def _update_image_ref(m):
             image_path = m.group(2)
             self.image_repo.count_usage(image_path)
             return m.group(1) + self.image_repo.translate_path(image_path) + m.group(3)
 
-        line_number = 0
-        while True:
-            line_number += 1
-            line = source.readline()
-            if line == '':
-                break
+        for line_number, line in enumerate(lines, 1):
             try:
                 result = re.sub(r"(.*?\!\[.*?\]\()(.*?)(\).*)", _update_image_ref, line)
                 if line != result:
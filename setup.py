@@ -1,5 +1,6 @@
 #!/usr/bin/env python
 import os
+import re
 from setuptools import setup, find_packages
 
 
@@ -7,10 +8,15 @@ def read(fname):
     return open(os.path.join(os.path.dirname(__file__), fname)).read()
 
 
+def version():
+    """Return the version from mdbuild/__init__.py (it is also part of the cache salt)."""
+    return re.search(r"^__version__ = '([^']+)'", read('mdbuild/__init__.py'), re.M).group(1)
+
+
 # TODO: make a nicer setup.py from https://github.com/navdeep-G/setup.py
 setup(
     name="mdtools",
-    version='2.1.3',
+    version=version(),
     packages=find_packages(exclude=["tests", "*.tests", "*.tests.*", "tests.*"]),
     install_requires=['polib'],
     author="Bernhard Bockelbrink",
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the persistent file info cache.
+"""
+
+import argparse
+import os
+from unittest import mock
+
+from tests.common import FileBasedTestCase
+
+from mdbuild import common, config, main
+from mdbuild.cache import FileInfoCache
+from mdbuild.config import ConfigObject
+from mdbuild.structure import get_info_cache
+
+
+class FileInfoCacheTests(FileBasedTestCase):
+
+    def setUp(self):
+        super(FileInfoCacheTests, self).setUp()
+        self.cache_file = self.tmp_path('cache', 'info.pickle')
+        self.source = self.tmp_path('source.md')
+        self._write_source('# my headline\n')
+
+    def _write_source(self, text):
+        with open(self.source, 'w') as f:
+            f.write(text)
+
+    def test_persistent_entries(self):
+        cache = FileInfoCache(self.cache_file, 'salt')
+        self.assertEqual(cache.get(self.source), None)
+        cache.set(self.source, ('my headline', '', {}))
+        cache.save()
+
+        cache = FileInfoCache(self.cache_file, 'salt')
+        self.assertEqual(cache.get(self.source), ('my headline', '', {}))
+
+    def test_changed_source_invalidates_entry(self):
+        cache = FileInfoCache(self.cache_file, 'salt')
+        cache.set(self.source, 'old')
+        self._write_source('# another headline\n')
+        self.assertEqual(cache.get(self.source), None)
+
+    def test_touched_source_keeps_entry(self):
+        cache = FileInfoCache(self.cache_file, 'salt')
+        cache.set(self.source, 'old')
+        st = os.stat(self.source)
+        os.utime(self.source, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+        self.assertEqual(cache.get(self.source), 'old')
+
+    def test_salt_invalidates_cache(self):
+        cache = FileInfoCache(self.cache_file, 'salt')
+        cache.set(self.source, 'old')
+        cache.save()
+        cache = FileInfoCache(self.cache_file, 'other salt')
+        self.assertEqual(cache.get(self.source), None)
+
+
+class InfoCacheSaltTests(FileBasedTestCase):
+
+    def salt(self, translations, variables):
+        cfg = ConfigObject({'preset': 'test', 'variables': variables})
+        with mock.patch('mdbuild.config.cfg', cfg), \
+                mock.patch('mdbuild.translate.translation_memory', translations), \
+                mock.patch('mdbuild.glossary.glossary', {'terms': {}}):
+            return get_info_cache(self.tmp_path('cache')).salt
+
+    def test_translations_and_variables(self):
+        salt = self.salt({'hello': 'hallo'}, {'title': 'A Book'})
+        self.assertEqual(self.salt({'hello': 'hallo'}, {'title': 'A Book'}), salt)
+        self.assertNotEqual(self.salt({'hello': 'salut'}, {'title': 'A Book'}), salt)
+        self.assertNotEqual(self.salt({'hello': 'hallo'}, {'title': 'Another Book'}), salt)
+
+
+class CompiledConfigTests(FileBasedTestCase):
+
+    def setUp(self):
+        super(CompiledConfigTests, self).setUp()
+        self.addCleanup(common.set_config_cache_dir, common.config_cache_dir)
+        os.mkdir(self.tmp_path('src'))
+        self.yaml = self.tmp_path('src', 'structure.yaml')
+        with open(self.yaml, 'w') as f:
+            f.write('parts: [intro]\n')
+
+    def test_compiled_in_cache_dir(self):
+        common.set_config_cache_dir(self.tmp_path('cache'))
+        self.assertEqual(common.read_config_file(self.yaml), {'parts': ['intro']})
+        self.assertEqual(len(os.listdir(self.tmp_path('cache', 'config'))), 1)
+        self.assertEqual(common.read_config_file(self.yaml), {'parts': ['intro']})
+        # nothing is written next to the yaml file
+        self.assertEqual(os.listdir(self.tmp_path('src')), ['structure.yaml'])
+
+    def test_no_cache_dir(self):
+        common.set_config_cache_dir(None)
+        self.assertEqual(common.read_config_file(self.yaml), {'parts': ['intro']})
+        self.assertEqual(sorted(os.listdir(self.document_root)), ['src'])
+
+    def test_project_file(self):
+        # the project file is compiled into the default cache dir (relative to the working directory)
+        cwd = os.getcwd()
+        self.addCleanup(os.chdir, cwd)
+        os.chdir(self.document_root)
+        args = argparse.Namespace(project=self.yaml, no_cache=False)
+        with mock.patch.dict(config.config_system_defaults, {'cache-dir': 'cache'}):
+            self.assertEqual(main.read_project_file(args), {'parts': ['intro']})
+        self.assertEqual(len(os.listdir(self.tmp_path('cache', 'config'))), 1)
+        args.no_cache = True
+        self.assertEqual(main.read_project_file(args), {'parts': ['intro']})
+        self.assertIsNone(common.config_cache_dir)
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the pooled markdown conversion.
+"""
+
+import unittest
+
+import markdown
+
+from mdbuild import common
+from mdbuild.common import MARKDOWN_EXTENSIONS, convert_markdown, markdown2html
+from mdbuild.renderer import Renderer
+from mdbuild.renderer.metadata import MetadataFilter
+
+
+class TestConvertMarkdown(unittest.TestCase):
+
+    TEXTS = [
+        'some *text*',
+        'a footnote[^1]\n\n[^1]: the note',
+        'title: meta data\n\nand a [link](http://example.com)',
+        'some *text*',
+    ]
+
+    def test_like_markdown(self):
+        for text in self.TEXTS:
+            self.assertEqual(markdown2html(text),
+                             markdown.markdown(text, extensions=list(MARKDOWN_EXTENSIONS)))
+            self.assertEqual(convert_markdown(text), markdown.markdown(text))
+
+    def test_reuse(self):
+        convert_markdown.cache_clear()
+        for text in self.TEXTS:
+            markdown2html(text)
+        # the last text was cached, and one converter did all the work
+        self.assertEqual(convert_markdown.cache_info().hits, 1)
+        self.assertEqual(len(common._converters[MARKDOWN_EXTENSIONS]), 1)
+        # footnotes do not leak into the next conversion
+        self.assertEqual(markdown2html('plain text'), '<p>plain text</p>')
+
+
+class TestSummaryHtml(unittest.TestCase):
+
+    def render(self, lines):
+        metadata_filter = MetadataFilter(target_format='html')
+        result = []
+        Renderer(lines, filters=[
+            metadata_filter.filter,
+            lambda lines: (result.append(line) or line for line in lines),
+        ]).render()
+        return ''.join(result)
+
+    def test_summary(self):
+        result = self.render(['# headline\n', '\n', '<summary>\n', 'a *summary*\n', 'in two lines\n',
+                              '</summary>\n', '\n', 'some text\n'])
+        self.assertIn('a <em>summary</em>\nin two lines\n</div></div>\n', result)
+
+    def test_unterminated_summary(self):
+        result = self.render(['# headline\n', '\n', '<summary>\n', 'a *summary*\n'])
+        self.assertTrue(result.endswith('a <em>summary</em>\n'))
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for recording dependencies and the manifest of incremental builds.
+"""
+
+import os
+from unittest import mock
+
+from tests.common import FileBasedTestCase
+
+from mdbuild import dependencies, glossary, translate
+from mdbuild.dependencies import Manifest, recording
+from mdbuild.textio import OutputFile
+
+GLOSSARY = {'title': 'Glossary', 'terms': {
+    'term': {'id': 'term', 'name': 'Term', 'glossary': 'a term', 'definition': 'a **term** is'},
+    'other': {'id': 'other', 'name': 'Other', 'glossary': 'another term', 'definition': 'other'},
+}}
+
+
+class TestDependencies(FileBasedTestCase):
+
+    def setUp(self):
+        super(TestDependencies, self).setUp()
+        for name, value in (('mdbuild.glossary.glossary', GLOSSARY),
+                            ('mdbuild.translate.translation_memory', {'hello': 'hallo'})):
+            patcher = mock.patch(name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.manifest_path = os.path.join(self.document_root, 'cache', 'manifest.pickle')
+        self.page = os.path.join(self.document_root, 'page.md')
+
+    def render(self, manifest, text):
+        """Render the page (if outdated), return True if it was rendered."""
+        if manifest.is_current(self.page, dependencies.digest(text)):
+            return False
+        with recording() as recorded:
+            with OutputFile(self.page) as target:
+                target.write(glossary.glossary_term_macro(None, None, 'term'))
+                target.write(translate.translate('hello'))
+        manifest.update(self.page, dependencies.digest(text), recorded)
+        return True
+
+    def test_recording(self):
+        dependencies.record('glossary', 'term')
+        with recording() as outer:
+            dependencies.record('glossary', 'term')
+            with recording() as inner:
+                translate.translate('hello')
+            dependencies.record('structure')
+        self.assertEqual(outer, {('glossary', 'term'), ('structure', None)})
+        self.assertEqual(inner, {('translation', 'hello')})
+        self.assertIsNone(dependencies.recorded)
+
+    def test_incremental(self):
+        manifest = Manifest(self.manifest_path, 'salt')
+        self.assertTrue(self.render(manifest, 'source'))
+        manifest.save()
+        manifest = Manifest(self.manifest_path, 'salt')
+        self.assertFalse(self.render(manifest, 'source'))
+        # a new source
+        self.assertTrue(self.render(manifest, 'changed source'))
+        manifest.save()
+        # an unrelated glossary term
+        with mock.patch.dict(GLOSSARY['terms'], {'other': {'glossary': 'changed'}}):
+            self.assertFalse(self.render(Manifest(self.manifest_path, 'salt'), 'changed source'))
+        # the output was changed
+        os.utime(self.page, ns=(0, 0))
+        self.assertTrue(self.render(manifest, 'changed source'))
+
+    def test_dependency_changes(self):
+        manifest = Manifest(self.manifest_path, 'salt')
+        self.render(manifest, 'source')
+        manifest.save()
+        with mock.patch.dict(GLOSSARY['terms'], {'term': {'glossary': 'changed'}}):
+            self.assertTrue(self.render(Manifest(self.manifest_path, 'salt'), 'source'))
+        with mock.patch.dict(translate.translation_memory, {'hello': 'salut'}):
+            self.assertTrue(self.render(Manifest(self.manifest_path, 'salt'), 'source'))
+        self.assertTrue(self.render(Manifest(self.manifest_path, 'other salt'), 'source'))
+
+    def test_kept_results(self):
+        self.addCleanup(dependencies._kept.clear)
+        manifest = dependencies.keep('preset', None, 'salt')
+        manifest.set_result('node', 'input', {('glossary', 'term')}, 'result')
+        manifest = dependencies.keep('preset', None, 'salt')
+        self.assertEqual(manifest.result('node', 'input'), 'result')
+        self.assertIsNone(manifest.result('node', 'changed input'))
+        with mock.patch.dict(GLOSSARY['terms'], {'term': {'glossary': 'changed'}}):
+            # keep() forgets the digests of the dependencies of the last build
+            self.assertIsNone(dependencies.keep('preset', None, 'salt').result('node', 'input'))
+        self.assertIsNone(dependencies.keep('preset', None, 'other salt').result('node', 'input'))
@@ -2,13 +2,14 @@
 
 import unittest
 
-from mdbuild.renderer import MetadataFilter
+from mdbuild.renderer import MetadataFilter, scan_metadata
 
 
 class TestMetadataFilter(unittest.TestCase):
 
     def _run_filter(self, target_format=None):
-        return [line for line in MetadataFilter.filter(iter(self.input), target_format=target_format)]
+        self.metadata_filter = MetadataFilter(target_format=target_format)
+        return [line for line in self.metadata_filter.filter(iter(self.input))]
 
 
 class TestMetadataFilterBasics(TestMetadataFilter):
@@ -33,13 +34,13 @@ class TestMetadataFilterBasics(TestMetadataFilter):
     def test_title_and_summary(self):
         """Title and summary are extracted properly."""
         self._run_filter()
-        self.assertEqual(MetadataFilter.title, 'my headline')
-        self.assertEqual(MetadataFilter.summary, 'this is my summary')
+        self.assertEqual(self.metadata_filter.title, 'my headline')
+        self.assertEqual(self.metadata_filter.summary, 'this is my summary')
 
         # if summary is enclosed in **, markup is removed properly
         self.input[3] = '**this is my summary**'
         res = self._run_filter(target_format="preserve")
-        self.assertEqual(MetadataFilter.summary, 'this is my summary')
+        self.assertEqual(self.metadata_filter.summary, 'this is my summary')
         self.assertEqual(res, [
             '# my headline',
             '',
@@ -52,7 +53,7 @@ class TestMetadataFilterBasics(TestMetadataFilter):
 
     def test_summary_format_html(self):
         res = self._run_filter(target_format='html')
-        self.assertEqual(MetadataFilter.summary, 'this is my summary')
+        self.assertEqual(self.metadata_filter.summary, 'this is my summary')
         self.assertEqual(res, [
             '# my headline',
             '',
@@ -64,7 +65,7 @@ class TestMetadataFilterBasics(TestMetadataFilter):
         ])
     def test_summary_format_epub(self):
         res = self._run_filter(target_format='epub')
-        self.assertEqual(MetadataFilter.summary, 'this is my summary')
+        self.assertEqual(self.metadata_filter.summary, 'this is my summary')
         self.assertEqual(res, [
             '# my headline',
             '',
@@ -76,7 +77,7 @@ class TestMetadataFilterBasics(TestMetadataFilter):
         ])
     def test_summary_format_latex(self):
         res = self._run_filter(target_format='latex')
-        self.assertEqual(MetadataFilter.summary, 'this is my summary')
+        self.assertEqual(self.metadata_filter.summary, 'this is my summary')
         self.assertEqual(res, [
             '# my headline',
             '',
@@ -86,7 +87,7 @@ class TestMetadataFilterBasics(TestMetadataFilter):
         ])
     def test_summary_format_none(self):
         res = self._run_filter(target_format=None)
-        self.assertEqual(MetadataFilter.summary, 'this is my summary')
+        self.assertEqual(self.metadata_filter.summary, 'this is my summary')
         self.assertEqual(res, [
             '# my headline',
             '',
@@ -118,11 +119,11 @@ class TestMetadataFilterMetadata(TestMetadataFilter):
     def test_metadata_extraction(self):
         self._run_filter()
 
-        self.assertEqual(MetadataFilter.title, 'my headline')
-        self.assertEqual(MetadataFilter.summary, 'this is my summary')
-        print(repr(MetadataFilter.metadata))
-        self.assertEqual(MetadataFilter.metadata['author'], 'John Doe')
-        self.assertEqual(MetadataFilter.metadata['menu-title'], 'a shorter title')
+        self.assertEqual(self.metadata_filter.title, 'my headline')
+        self.assertEqual(self.metadata_filter.summary, 'this is my summary')
+        print(repr(self.metadata_filter.metadata))
+        self.assertEqual(self.metadata_filter.metadata['author'], 'John Doe')
+        self.assertEqual(self.metadata_filter.metadata['menu-title'], 'a shorter title')
 
     def test_metadata_removal(self):
         """Metadata is removed from file."""
@@ -136,3 +137,43 @@ class TestMetadataFilterMetadata(TestMetadataFilter):
             'some text'
         ])
 
+
+class TestScanMetadata(unittest.TestCase):
+
+    def test_same_results_as_filter(self):
+        lines = [
+            '[:author]: # "John Doe"',
+            '',
+            '# my headline',
+            '',
+            '<summary>',
+            '**this is my summary**',
+            '</summary>',
+            '',
+            'some text']
+        metadata_filter = MetadataFilter()
+        for line in metadata_filter.filter(iter(lines)):
+            pass
+        self.assertEqual(scan_metadata(lines),
+                         (metadata_filter.title, metadata_filter.summary, metadata_filter.metadata))
+
+    def test_stop_after_summary(self):
+        lines = iter(['# my headline', '', '<summary>', 'this is my summary', '</summary>', 'some text'])
+        self.assertEqual(scan_metadata(lines), ('my headline', 'this is my summary', {}))
+        self.assertEqual(next(lines), 'some text')
+
+    def test_stop_at_first_paragraph(self):
+        lines = iter(['# my headline', '', 'some text', 'more text'])
+        self.assertEqual(scan_metadata(lines), ('my headline', None, {}))
+        self.assertEqual(next(lines), 'more text')
+
+    def test_expand_scanned_lines(self):
+        lines = ['# my {{macro}}', '', 'some {{macro}}']
+        expanded = []
+
+        def expand(line):
+            expanded.append(line)
+            return line.replace('{{macro}}', 'headline')
+
+        self.assertEqual(scan_metadata(lines, expand), ('my headline', None, {}))
+        self.assertEqual(len(expanded), 3)
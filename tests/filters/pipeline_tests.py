@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import unittest
+
+from mdbuild.renderer import Renderer, filters
+from mdbuild.renderer.pipeline import BatchedFilter, FusedFilter, batch_lines, compile_pipeline, is_batched, unbatch
+
+
+class TestCompilePipeline(unittest.TestCase):
+
+    def setUp(self):
+        self.input = [
+            '# headline',
+            '',
+            'see [the other section](section:other)',
+            '---',
+            '![inline](img/foo.png)',
+            '![fit](img/background.png)',
+            'nothing to do here',
+        ]
+        self.filters = [
+            partial(filters.convert_section_links, 'html'),
+            filters.clean_images,
+            filters.remove_breaks_and_conts,
+            partial(filters.increase_all_headline_levels, 2),
+        ]
+
+    def render(self, optimize):
+        result = []
+        renderer = Renderer(iter(self.input), filters=self.filters, optimize=optimize)
+        renderer.add_filter(lambda lines: (result.append(line) or line for line in lines))
+        renderer.render()
+        return result
+
+    def test_same_output(self):
+        self.assertEqual(self.render(True), self.render(False))
+        self.assertEqual(self.render(True), [
+            '### headline',
+            '',
+            'see [the other section](other.html)',
+            '![](img/foo.png)',
+            '',
+            'nothing to do here',
+        ])
+
+    def test_fuse(self):
+        skip_only = filters.SkipOnlyFilter()
+        stages = compile_pipeline(self.filters + [skip_only.filter, filters.unescape_macros])
+        # filters keep their order
+        self.assertEqual(len(stages), 3)
+        self.assertTrue(isinstance(stages[0], FusedFilter))
+        self.assertEqual([spec.filter for spec in stages[0].specs], self.filters)
+        self.assertTrue(isinstance(stages[1], BatchedFilter))
+        self.assertEqual(stages[1].spec.filter, skip_only.filter)
+        self.assertEqual([spec.filter for spec in stages[2].specs], [filters.unescape_macros])
+        # remove_breaks_and_conts must see every line, unescape_macros only lines with sentinels
+        self.assertEqual(stages[0].gate, None)
+        self.assertNotEqual(stages[2].gate, None)
+
+    def test_barrier(self):
+        stages = compile_pipeline([filters.clean_images, filters.prefix_headline, filters.clean_images])
+        self.assertEqual(len(stages), 3)
+        self.assertEqual(stages[1], filters.prefix_headline)
+        self.assertEqual([is_batched(stage) for stage in stages], [True, False, True])
+
+
+class TestBatches(unittest.TestCase):
+
+    def setUp(self):
+        self.input = [
+            '[:author]: # "Jane Doe"\n',
+            '\n',
+            '# headline\n',
+            '\n',
+            '<summary>\n',
+            'the summary\n',
+            '</summary>\n',
+            '\n',
+            'see [the other section](section:other)\n',
+            '![fit](img/background.png)\n',
+            'nothing to do here\n',
+        ]
+
+    def test_adapters(self):
+        batches = list(batch_lines(iter(self.input), 4))
+        self.assertEqual([len(batch) for batch in batches], [4, 4, 3])
+        self.assertEqual(list(unbatch(batches)), self.input)
+
+    def test_batch_filter(self):
+        expected = list(filters.MetadataFilter(target_format='epub').filter(iter(self.input)))
+        for size in (1, 2, 3, 100):
+            metadata_filter = filters.MetadataFilter(target_format='epub')
+            batches = metadata_filter.filter_batches(batch_lines(self.input, size))
+            self.assertEqual(list(unbatch(batches)), expected)
+            self.assertEqual(metadata_filter.title, 'headline')
+            self.assertEqual(metadata_filter.summary, 'the summary')
+
+    def test_front_matter(self):
+        lines = ['# headline\n', 'text\n']
+        expected = list(filters.jekyll_front_matter({'key': 'value'}, iter(lines)))
+        batches = filters.jekyll_front_matter_batches({'key': 'value'}, [[], lines[:1], lines[1:]])
+        self.assertEqual(list(unbatch(batches)), expected)
+
+
+
+class TestConcurrentRenders(unittest.TestCase):
+
+    def render(self, number):
+        lines = ['[:author]: # "author %s"\n' % number, '\n', '# headline %s\n' % number, '\n',
+                 '<summary>\n', 'summary %s\n' % number, '</summary>\n']
+        lines += ['line %s of [document %s](section:doc-%s)\n' % (i, number, number) for i in range(1000)]
+        metadata_filter = filters.MetadataFilter(target_format='epub')
+        result = []
+        renderer = Renderer(iter(lines), filters=[
+            metadata_filter.filter,
+            filters.SkipOnlyFilter().filter,
+            partial(filters.convert_section_links, 'html'),
+            lambda lines: (result.append(line) or line for line in lines),
+        ])
+        renderer.render()
+        return metadata_filter.title, metadata_filter.summary, metadata_filter.metadata, result
+
+    def test_same_as_serial(self):
+        serial = [self.render(number) for number in range(20)]
+        with ThreadPoolExecutor(4) as pool:
+            concurrent = list(pool.map(self.render, range(20)))
+        self.assertEqual(concurrent, serial)
+        self.assertEqual(concurrent[7][0], 'headline 7')
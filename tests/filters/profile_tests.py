@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+
+import re
+import unittest
+
+from mdbuild.renderer import Renderer, profile
+
+
+class TestFilterProfile(unittest.TestCase):
+
+    def setUp(self):
+        self.profiler = profile.enable_profiling()
+        self.addCleanup(setattr, profile, 'profiler', None)
+
+    def test_lines_and_substitutions(self):
+        pattern = re.compile('a')
+
+        def replace_a(lines):
+            for line in lines:
+                yield profile.substitute(pattern, 'b', line)
+
+        def drop_empty(lines):
+            for line in lines:
+                if line:
+                    yield line
+
+        renderer = Renderer(iter(['a', '', 'aa']), filters=[drop_empty, replace_a], name='node')
+        output = []
+        renderer.add_filter(lambda lines: (output.append(line) or line for line in lines))
+        renderer.render()
+
+        self.assertEqual(output, ['b', 'bb'])
+        drop = self.profiler.filters['TestFilterProfile.test_lines_and_substitutions.<locals>.drop_empty']
+        self.assertEqual((drop.lines_in, drop.lines_out), (3, 2))
+        replace = self.profiler.filters['TestFilterProfile.test_lines_and_substitutions.<locals>.replace_a']
+        self.assertEqual((replace.lines_in, replace.lines_out, replace.substitutions), (2, 2, 3))
+        self.assertEqual(self.profiler.nodes['node'].renders, 1)
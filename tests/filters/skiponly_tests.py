@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+
+from functools import partial
+import unittest
+
+from mdbuild.common import edition_path
+from mdbuild.macros import MacroFilter, register_macro
+from mdbuild.renderer import FanOutRenderer, Renderer, Target, filters
+from mdbuild.renderer.skiponly import SkipOnlyFanOut
+from mdbuild.renderer.source import parse_source
+
+
+LINES = [
+    '# headline\n',
+    '\n',
+    'for everyone\n',
+    '\n',
+    '<only editions="print">\n',
+    'only in print\n',
+    '<skip formats="epub">\n',
+    'in print, but not in the epub\n',
+    '</skip>\n',
+    '</only>\n',
+    '\n',
+    '<skip editions="print">\n',
+    '<skip presets="slides">\n',
+    'not in print {{version:skip=slides}}\n',
+    '</skip>\n',
+    '</skip>\n',
+    '\n',
+    'for everyone {{version:only=book}}\n',
+]
+
+TARGETS = [
+    Target('book', 'standard', 'html'),
+    Target('book', 'print', 'html'),
+    Target('book', 'print', 'epub'),
+    Target('slides', 'standard', 'html'),
+]
+
+
+class TestFanOut(unittest.TestCase):
+
+    def setUp(self):
+        register_macro('version', lambda *args, **kwargs: '1.0')
+
+    def branch_filters(self, results, target):
+        return [
+            partial(MacroFilter.filter, preset=target.preset),
+            lambda lines: (results[target].append(line) or line for line in lines),
+        ]
+
+    def render(self, target, input):
+        result = []
+        renderer = Renderer(input, filters=[
+            filters.SkipOnlyFilter(target).filter,
+            partial(MacroFilter.filter, preset=target.preset),
+            lambda lines: (result.append(line) or line for line in lines),
+        ])
+        renderer.render()
+        return result
+
+    def test_fan_out(self):
+        for input, optimize in ((LINES, True), (parse_source(LINES), True), (parse_source(LINES), False)):
+            results = {target: [] for target in TARGETS}
+            FanOutRenderer(input, TARGETS, partial(self.branch_filters, results), optimize=optimize).render()
+            for target in TARGETS:
+                self.assertEqual(results[target], self.render(target, LINES))
+
+    def test_streaming(self):
+        read = []
+
+        def batches():
+            for number in range(100):
+                read.append(number)
+                yield ['line %s\n' % number]
+        branches = SkipOnlyFanOut(TARGETS).split(batches())
+        self.assertEqual(read, [])
+        # the input is split as the branches are read
+        self.assertEqual(next(branches[0]), ['line 0\n'])
+        self.assertEqual(next(branches[1]), ['line 0\n'])
+        self.assertEqual(read, [0])
+        self.assertEqual(next(branches[1]), ['line 1\n'])
+        self.assertEqual(read, [0, 1])
+        self.assertEqual(len(list(branches[2])), 100)
+        self.assertEqual(len(list(branches[0])), 99)
+
+    def test_branches(self):
+        results = {target: [] for target in TARGETS}
+        FanOutRenderer(LINES, TARGETS, partial(self.branch_filters, results)).render()
+        self.assertEqual(results[TARGETS[0]][4:], ['\n', 'not in print 1.0\n', '\n', 'for everyone 1.0\n'])
+        self.assertEqual(results[TARGETS[1]][4:], ['only in print\n', 'in print, but not in the epub\n',
+                                                    '\n', '\n', 'for everyone 1.0\n'])
+        self.assertEqual(results[TARGETS[2]][4:], ['only in print\n', '\n', '\n', 'for everyone 1.0\n'])
+        self.assertEqual(results[TARGETS[3]][4:], ['\n', '\n', 'for everyone \n'])
+
+    def test_mismatched_tags(self):
+        renderer = FanOutRenderer(['<skip editions="print">\n', '</only>\n'], TARGETS, lambda target: [])
+        with self.assertRaises(Exception):
+            renderer.render()
+
+    def test_edition_path(self):
+        self.assertEqual(edition_path('build/book.md', 'print'), 'build/book-print.md')
+        self.assertEqual(edition_path('build/slides/', 'print'), 'build/slides-print')
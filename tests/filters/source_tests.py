@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+
+from functools import partial
+import os
+import shutil
+import tempfile
+import unittest
+
+# registers the macro marker ({{) with the sources
+import mdbuild.macros  # noqa: F401
+from mdbuild.renderer import Renderer, filters
+from mdbuild.renderer import source
+from mdbuild.renderer.pipeline import batch_lacks
+from mdbuild.renderer.source import load_source, parse_source
+
+
+LINES = [
+    '[:author]: # "Jane Doe"\n',
+    '\n',
+    '# headline\n',
+    '\n',
+    '<summary>\n',
+    'the summary\n',
+    '</summary>\n',
+    '\n',
+    'see [the other section](section:other)\n',
+    'and more text\n',
+    '\n',
+    '\n',
+    '![fit](img/background.png)\n',
+    '\n',
+    'nothing to do here\n',
+]
+
+
+class TestParsedSource(unittest.TestCase):
+
+    def setUp(self):
+        self.parsed = parse_source(LINES)
+
+    def test_blocks(self):
+        self.assertEqual([(start, end) for start, end, markers in self.parsed.blocks],
+                         [(0, 2), (2, 4), (4, 8), (8, 12), (12, 14), (14, 15)])
+        self.assertIn('](section:', self.parsed.blocks[3][2])
+        self.assertNotIn('![', self.parsed.blocks[3][2])
+
+    def test_batches(self):
+        batches = list(self.parsed.batches(size=3))
+        self.assertEqual(sum(batches, []), LINES)
+        # the header and summary are batches of their own
+        self.assertEqual(batches[0], LINES[:2])
+        self.assertEqual(batches[2], LINES[4:8])
+        self.assertTrue(batch_lacks(batches[-1], ['{{', '](section:']))
+        self.assertFalse(batch_lacks(batches[3], ['](section:']))
+        self.assertFalse(batch_lacks(LINES, ['{{']))
+
+    def test_render(self):
+        def render(input, optimize):
+            result = []
+            renderer = Renderer(input, optimize=optimize, filters=[
+                filters.MetadataFilter(target_format='epub').filter,
+                filters.remove_breaks_and_conts,
+                filters.SkipOnlyFilter().filter,
+                partial(filters.convert_section_links, 'html'),
+                filters.clean_images,
+                lambda lines: (result.append(line) or line for line in lines),
+            ])
+            renderer.render()
+            return result
+        expected = render(LINES, False)
+        self.assertEqual(render(self.parsed, True), expected)
+        self.assertEqual(render(self.parsed, False), expected)
+
+
+class TestLoadSource(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.addCleanup(source._sources.clear)
+        self.path = os.path.join(self.directory, 'page.md')
+        with open(self.path, 'w') as f:
+            f.writelines(LINES)
+
+    def test_memo(self):
+        digest = source.source_digest(self.path)
+        parsed = load_source(self.path)
+        self.assertEqual(parsed.lines, LINES)
+        # the same content is only parsed once, the digest is kept
+        self.assertIs(load_source(self.path), parsed)
+        self.assertEqual(source._sources[self.path][2:], (digest, parsed))
+        with open(self.path, 'a') as f:
+            f.write('more text\n')
+        self.assertNotEqual(source.source_digest(self.path), digest)
+        self.assertIsNot(load_source(self.path), parsed)
+
+    def test_unchanged_file_is_not_read(self):
+        parsed = load_source(self.path)
+        st = os.stat(self.path)
+        # same size and mtime: the file is not read again
+        with open(self.path, 'w') as f:
+            f.writelines(line.upper() for line in LINES)
+        os.utime(self.path, ns=(st.st_atime_ns, st.st_mtime_ns))
+        self.assertIs(load_source(self.path), parsed)
+        os.utime(self.path, ns=(st.st_atime_ns, st.st_mtime_ns + 1000))
+        self.assertEqual(load_source(self.path).lines[2], '# HEADLINE\n')
+
+    def test_prune(self):
+        other = os.path.join(self.directory, 'other.md')
+        with open(other, 'w') as f:
+            f.write('# other\n')
+        load_source(self.path)
+        load_source(other)
+        source.prune([self.path])
+        self.assertEqual(list(source._sources), [self.path])
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for glossary links.
+"""
+
+import io
+import unittest
+from unittest import mock
+
+from mdbuild.glossary import GlossaryLinkFootnote
+
+GLOSSARY = {'title': 'Glossary', 'terms': {
+    'driver': {'id': 'driver', 'name': 'Driver', 'glossary': 'a reason'},
+    'pattern': {'id': 'pattern', 'name': 'Pattern', 'glossary': 'a solution'},
+}}
+
+
+class TestGlossaryLinkFootnote(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch('mdbuild.glossary.glossary', GLOSSARY)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def footnotes(self, footnote_renderer):
+        target = io.StringIO()
+        footnote_renderer.glossary_post_processing(target)
+        return target.getvalue()
+
+    def test_merge(self):
+        # one renderer for all nodes
+        single = GlossaryLinkFootnote()
+        list(single.replace_glossary_references(['a [pattern](glossary:pattern)\n',
+                                                 'a [driver](glossary:driver)\n']))
+        # one renderer per node (e.g. in worker processes), merged afterwards
+        merged = GlossaryLinkFootnote()
+        for line in ['a [pattern](glossary:pattern)\n', 'a [driver](glossary:driver)\n']:
+            worker = GlossaryLinkFootnote()
+            self.assertEqual(list(worker.replace_glossary_references([line])),
+                             list(single.replace_glossary_references([line])))
+            merged.merge(worker.collected())
+        self.assertEqual(self.footnotes(merged), self.footnotes(single))
+        self.assertIn('[^driver]: Driver: a reason', self.footnotes(merged))
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+Conformance of the markdown backends: glossary entries, summaries and
+index entries must render the same with every installed backend.
+"""
+
+import importlib
+import unittest
+from unittest import mock
+
+from mdbuild import common
+from mdbuild.common import MARKDOWN_BACKENDS, set_markdown_backend
+from mdbuild.glossary import JekyllGlossaryRenderer
+from mdbuild.macros.index import IndexMacro
+from mdbuild.renderer import Renderer
+from mdbuild.renderer.metadata import MetadataFilter
+
+
+def installed(name):
+    module = MARKDOWN_BACKENDS[name][0]
+    if module is None:
+        return True
+    try:
+        importlib.import_module(module)
+    except ImportError:
+        return False
+    return True
+
+
+GLOSSARY = [
+    'A collection of explanations for words the reader might not be familiar with.',
+    'A **glossary** is collection of _explanations_ for words.',
+    'See [the index](index.html) for `code` & more.',
+    'status: a term that looks like metadata',
+]
+
+SUMMARIES = [
+    ['This page demonstrates a simple index with summaries\n'],
+    ['The _index macro_ can render parts of the structure\n', 'as an index in **various** styles.\n'],
+]
+
+INDEX = [
+    ('Index Macro', 'macros/index-macro', 'The _index macro_ renders parts of the structure.'),
+    ('Styles', 'styles-and-assets', 'Styles and *other* assets.'),
+    ('Empty', 'empty', None),
+]
+
+
+class TestMarkdownBackends(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch('mdbuild.glossary.glossary', {'title': 'Glossary', 'terms': {}})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        set_markdown_backend('python-markdown')
+
+    def render_fragments(self, backend):
+        set_markdown_backend(backend)
+        result = []
+        for text in GLOSSARY:
+            result.append(JekyllGlossaryRenderer().format_item({'glossary': text})['glossary'])
+        for summary in SUMMARIES:
+            lines = []
+            Renderer(['# headline\n', '\n', '<summary>\n'] + summary + ['</summary>\n'], filters=[
+                MetadataFilter(target_format='html').filter,
+                lambda stream: (lines.append(line) or line for line in stream),
+            ]).render()
+            result.append(''.join(lines))
+        for title, path, summary in INDEX:
+            result.append(IndexMacro.html_index_element(title, path, summary))
+        return result
+
+    def test_conformance(self):
+        expected = self.render_fragments('python-markdown')
+        for backend in sorted(MARKDOWN_BACKENDS):
+            with self.subTest(backend=backend):
+                if not installed(backend):
+                    self.skipTest("%s is not installed" % backend)
+                self.assertEqual(self.render_fragments(backend), expected)
+
+    def test_fallback(self):
+        with mock.patch.dict(MARKDOWN_BACKENDS, {'mistune': ('no_such_markdown_module', None)}):
+            set_markdown_backend('mistune')
+        self.assertEqual(common.markdown_backend, 'python-markdown')
+
+    def test_strip_meta(self):
+        self.assertEqual(common._strip_meta('title: a page\n    more\nauthor: me\n\nsome text'), 'some text')
+        self.assertEqual(common._strip_meta('some text\nkey: value'), 'some text\nkey: value')
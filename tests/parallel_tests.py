@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for running parts of a build in worker processes.
+"""
+
+import logging
+import os
+
+from tests.common import FileBasedTestCase
+
+from mdbuild import textio
+from mdbuild.parallel import get_context, inherited_map, ordered_map
+from mdbuild.textio import OutputFile
+
+logger = logging.getLogger('mdbuild.tests.parallel')
+
+
+def make_page(args):
+    path, number = args
+    logger.warning("page %s from %s" % (number, os.getpid()))
+    if number == 3:
+        raise ValueError('no page 3')
+    with OutputFile(path) as target:
+        target.write('page %s\n' % number)
+    return number * 2
+
+
+class TestOrderedMap(FileBasedTestCase):
+
+    def setUp(self):
+        super(TestOrderedMap, self).setUp()
+        self.records = []
+        handler = logging.Handler()
+        handler.emit = self.records.append
+        logging.root.addHandler(handler)
+        self.addCleanup(logging.root.removeHandler, handler)
+
+    def items(self, count):
+        return [(os.path.join(self.document_root, 'page-%s.md' % number), number) for number in range(count)]
+
+    def test_results_and_logs_in_order(self):
+        if get_context() is None:
+            self.skipTest("can't fork")
+        changed = textio.output_stats['changed']
+        self.assertEqual(ordered_map(make_page, self.items(3), jobs=3), [0, 2, 4])
+        messages = [record.getMessage() for record in self.records if record.name == logger.name]
+        self.assertEqual([message.split(' from ')[0] for message in messages], ['page 0', 'page 1', 'page 2'])
+        # the pages were made by workers
+        self.assertNotIn('from %s' % os.getpid(), ' '.join(messages))
+        self.assertEqual(textio.output_stats['changed'], changed + 3)
+
+    def test_errors(self):
+        with self.assertRaises(SystemExit):
+            ordered_map(make_page, self.items(5), jobs=2, describe=lambda item: 'page %s' % item[1])
+        errors = [record.getMessage() for record in self.records if record.levelno == logging.ERROR]
+        self.assertEqual(errors, ['page 3: ValueError: no page 3', '1 of 5 items failed'])
+        # the other pages were made
+        self.assertEqual(len(os.listdir(self.document_root)), 4)
+
+    def test_serial(self):
+        with self.assertRaises(ValueError):
+            ordered_map(make_page, self.items(5))
+
+    def test_inherited(self):
+        if get_context() is None:
+            self.skipTest("can't fork")
+        pages = []
+        # a function that can't be pickled
+        results = inherited_map(lambda item: pages.append(item) or make_page(item), self.items(3), jobs=2)
+        self.assertEqual(results, [0, 2, 4])
+        # it ran in the workers
+        self.assertEqual(pages, [])
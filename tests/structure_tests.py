@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for navigating the content structure.
+"""
+
+import os
+import unittest
+from unittest import mock
+
+from tests.common import FileBasedTestCase
+
+from mdbuild import macros, structure
+from mdbuild.config import ConfigObject
+from mdbuild.structure import ContentRoot
+
+
+class StructureNavigationTests(unittest.TestCase):
+
+    def setUp(self):
+        self.structure = ContentRoot.from_config({
+            'config': {},
+            'parts': [
+                'introduction',
+                {
+                    'id': 'chapter-1',
+                    'parts': [
+                        {'id': 'section-1', 'tags': ['pattern', 'draft']},
+                        {
+                            'id': 'section-2',
+                            'tags': ['pattern', 'governance'],
+                            'parts': ['subsection-1', {'id': 'subsection-2', 'tags': ['governance']}],
+                        },
+                    ],
+                },
+                {
+                    'id': 'appendix',
+                    'parts': ['glossary', {'id': 'section-1', 'tags': ['pattern']}],
+                },
+            ],
+        })
+
+    def slugs(self, nodes):
+        return [node.slug if node else None for node in nodes]
+
+    def test_reading_order(self):
+        self.assertEqual(self.slugs(self.structure.reading_order), [
+            'introduction', 'chapter-1', 'section-1', 'section-2', 'subsection-1',
+            'subsection-2', 'appendix', 'glossary', 'section-1'])
+
+    def test_successor_and_predecessor(self):
+        successors = []
+        current_node = self.structure.parts[0]
+        while current_node:
+            successors.append(current_node)
+            current_node = current_node.successor
+        self.assertEqual(successors, self.structure.reading_order)
+
+        predecessors = [node.predecessor for node in self.structure.reading_order]
+        self.assertEqual(predecessors, [None] + self.structure.reading_order[:-1])
+
+    def test_last_descendant_and_next_sibling(self):
+        chapter = self.structure.find('chapter-1')
+        self.assertEqual(chapter.last_descendant.slug, 'subsection-2')
+        self.assertEqual(chapter.next_sibling_or_ancestor_sibling.slug, 'appendix')
+        subsection = self.structure.find('subsection-2')
+        self.assertEqual(subsection.next_sibling_or_ancestor_sibling.slug, 'appendix')
+        self.assertEqual(self.structure.find('appendix').next_sibling_or_ancestor_sibling, None)
+
+    def test_find(self):
+        self.assertEqual(self.structure.find('section-1').parent.slug, 'chapter-1')
+        appendix = self.structure.find('appendix')
+        self.assertEqual(appendix.find('section-1').parent, appendix)
+        self.assertEqual(appendix.find('subsection-1'), None)
+        self.assertEqual(self.structure.find('unknown'), None)
+
+    def test_tag_index(self):
+        select = self.structure.tag_index.select
+        self.assertEqual(self.slugs(select(['pattern'])), ['section-1', 'section-2', 'section-1'])
+        self.assertEqual(self.slugs(select(['pattern+governance'])), ['section-2'])
+        self.assertEqual(self.slugs(select(['pattern+-draft|governance'])),
+                         ['section-2', 'subsection-2', 'section-1'])
+        self.assertEqual(self.slugs(select(['pattern', '-draft'])), ['section-2', 'section-1'])
+        self.assertEqual(self.slugs(select(['pattern'], within=self.structure.find('appendix'))), ['section-1'])
+        self.assertEqual(select(['unknown']), [])
+
+    def test_selected_nodes(self):
+        self.assertEqual(self.structure.selected_nodes(), self.structure.reading_order)
+        self.structure.select(['section-2', 'appendix', 'subsection-1'])
+        self.assertEqual(self.slugs(self.structure.selected_nodes()), [
+            'section-2', 'subsection-1', 'subsection-2', 'appendix', 'glossary', 'section-1'])
+        self.assertRaises(Exception, self.structure.select, ['unknown'])
+
+    def test_paths(self):
+        subsection = self.structure.find('subsection-1')
+        self.assertEqual(subsection.id, '.chapter-1.section-2.subsection-1')
+        self.assertEqual(subsection.relpath, 'chapter-1/section-2/subsection-1')
+        self.structure.root_path = 'content'
+        self.assertEqual(subsection.path, 'content/chapter-1/section-2/subsection-1')
+        # paths follow changes of the root path
+        self.structure.root_path = 'other'
+        self.assertEqual(subsection.path, 'other/chapter-1/section-2/subsection-1')
+
+    def test_view(self):
+        # templates see the types of the structure file
+        self.structure.root_path = 'content'
+        view = self.structure.find('section-2').view
+        self.assertEqual(view['tags'], ['pattern', 'governance'])
+        self.assertEqual(view['config'], {})
+        self.assertEqual('%(tags)s' % view, "['pattern', 'governance']")
+        self.assertEqual(self.structure.find('section-2').to_dict()['tags'], ['pattern', 'governance'])
+
+    def test_root(self):
+        for node in self.structure.reading_order:
+            self.assertTrue(node.root is self.structure)
+
+
+class SetStructureTests(FileBasedTestCase):
+
+    def setUp(self):
+        super(SetStructureTests, self).setUp()
+        for name, value in (('mdbuild.config.cfg', ConfigObject({'variables': {'title': 'A Book'}})),
+                            ('mdbuild.glossary.glossary', {'terms': {}}),
+                            ('mdbuild.translate.translation_memory', {})):
+            patcher = mock.patch(name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(structure.clear_structure)
+        self.addCleanup(macros.clear_macros)
+        self.structure_file = self.tmp_path('structure.yaml')
+        with open(self.structure_file, 'w') as f:
+            f.write('config: {}\nparts: [introduction]\n')
+        os.mkdir(self.tmp_path('content'))
+        with open(self.tmp_path('content', 'introduction.md'), 'w') as f:
+            f.write('# Introduction\n')
+
+    def set_structure(self):
+        structure.set_structure(self.structure_file, self.tmp_path('content'))
+        return structure.structure
+
+    def test_keep_structure(self):
+        content = self.set_structure()
+        self.assertEqual(content.find('introduction').title, 'Introduction')
+        # e.g. the next preset
+        self.assertIs(self.set_structure(), content)
+        # titles might depend on variables
+        with mock.patch('mdbuild.config.cfg', ConfigObject({'variables': {'title': 'Another Book'}})):
+            self.assertIsNot(self.set_structure(), content)
+        structure.clear_structure()
+        self.assertIsNot(self.set_structure(), content)
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the buffered text I/O layer.
+"""
+
+import codecs
+import os
+
+from tests.common import FileBasedTestCase
+
+from mdbuild import textio
+from mdbuild.textio import OutputFile, TextWriter, read_lines, read_text
+
+
+class TestTextIO(FileBasedTestCase):
+
+    CONTENT = u'# headline\r\n\r\nsome text – with ümlauts\nlast line\rwithout newline'
+
+    def write_source(self):
+        path = self.tmp_path('source.md')
+        with open(path, 'wb') as f:
+            f.write(self.CONTENT.encode('utf-8'))
+        return path
+
+    def test_read_lines_like_codecs(self):
+        path = self.write_source()
+        with codecs.open(path, 'r', 'utf-8') as source:
+            self.assertEqual(read_lines(path), list(source))
+        self.assertEqual(''.join(read_lines(path)), self.CONTENT)
+
+    def test_write_unchanged(self):
+        path = self.tmp_path('target.md')
+        with TextWriter(path, buffer_size=10) as target:
+            for line in read_lines(self.write_source()):
+                target.write(line)
+        self.assertEqual(read_text(path), self.CONTENT)
+
+    def test_append(self):
+        path = self.tmp_path('target.md')
+        with TextWriter(path) as target:
+            target.write('first\n')
+        with TextWriter(path, append=True) as target:
+            target.writelines(['second\n', 'third\n'])
+        self.assertEqual(read_lines(path), ['first\n', 'second\n', 'third\n'])
+
+    def test_buffering(self):
+        path = self.tmp_path('target.md')
+        with TextWriter(path, buffer_size=10) as target:
+            target.write('short\n')
+            self.assertEqual(read_text(path), '')
+            target.write('long enough\n')
+            self.assertEqual(read_text(path), 'short\nlong enough\n')
+
+
+class TestOutputFile(FileBasedTestCase):
+
+    def write(self, path, text):
+        with OutputFile(path) as target:
+            target.write(text)
+        return target.changed
+
+    def test_write_only_if_changed(self):
+        path = self.tmp_path('page.md')
+        self.assertTrue(self.write(path, 'some text\n'))
+        os.utime(path, ns=(0, 0))
+        changed = textio.output_stats['changed']
+        self.assertFalse(self.write(path, 'some text\n'))
+        self.assertEqual(os.stat(path).st_mtime_ns, 0)
+        self.assertTrue(self.write(path, 'other text\n'))
+        self.assertEqual(read_text(path), 'other text\n')
+        self.assertEqual(textio.output_stats['changed'], changed + 1)
+
+    def test_no_output_on_error(self):
+        path = self.tmp_path('page.md')
+        self.write(path, 'some text\n')
+        with self.assertRaises(ValueError):
+            with OutputFile(path) as target:
+                target.write('half a page')
+                raise ValueError()
+        self.assertEqual(read_text(path), 'some text\n')
+        self.assertEqual(os.listdir(self.document_root), ['page.md'])
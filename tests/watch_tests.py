@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for watching the inputs of a build.
+"""
+
+import os
+import threading
+
+from tests.common import FileBasedTestCase
+
+from mdbuild.watch import InotifyWatcher, PollingWatcher
+
+
+class WatcherTests(object):
+    """
+    Tests for all watchers, mixed into a TestCase per watcher that
+    defines make_watcher().
+    """
+
+    def setUp(self):
+        super(WatcherTests, self).setUp()
+        self.content = os.path.join(self.document_root, 'content')
+        os.makedirs(os.path.join(self.content, 'sub'))
+        self.page = self.write(os.path.join(self.content, 'sub', 'page.md'), 'page')
+        self.config = self.write(os.path.join(self.document_root, 'project.yaml'), 'config')
+        self.other = self.write(os.path.join(self.document_root, 'other.yaml'), 'other')
+        self.watcher = self.make_watcher()
+        self.addCleanup(self.watcher.close)
+        self.watcher.watch([self.config], [self.content])
+
+    def write(self, path, text):
+        with open(path, 'a') as f:
+            f.write(text)
+        return path
+
+    def test_changes(self):
+        self.assertEqual(self.watcher.wait(0.05), set())
+        self.write(self.page, ' changed')
+        self.write(self.config, ' changed')
+        new_page = self.write(os.path.join(self.content, 'new.md'), 'new')
+        self.assertEqual(self.watcher.wait(2), {self.page, self.config, new_page})
+
+    def test_ignored(self):
+        self.write(self.other, ' changed')
+        self.write(os.path.join(self.content, '.page.md.swp'), 'swap')
+        self.write(os.path.join(self.content, 'page.md~'), 'backup')
+        self.assertEqual(self.watcher.wait(0.3), set())
+
+    def test_debounce(self):
+        # a change while waiting for the debounce delay is reported with the first change
+        timer = threading.Timer(0.05, self.write, (self.config, ' changed'))
+        self.write(self.page, ' changed')
+        timer.start()
+        self.addCleanup(timer.join)
+        self.assertEqual(self.watcher.wait(2), {self.page, self.config})
+
+
+class TestInotifyWatcher(WatcherTests, FileBasedTestCase):
+
+    def make_watcher(self):
+        try:
+            return InotifyWatcher(debounce=0.2)
+        except (AttributeError, OSError):
+            self.skipTest('inotify is not available')
+
+    def test_new_directory(self):
+        directory = os.path.join(self.content, 'new')
+        os.mkdir(directory)
+        self.assertEqual(self.watcher.wait(2), {directory})
+        page = self.write(os.path.join(directory, 'page.md'), 'page')
+        self.assertEqual(self.watcher.wait(2), {page})
+
+
+class TestPollingWatcher(WatcherTests, FileBasedTestCase):
+
+    def make_watcher(self):
+        return PollingWatcher(debounce=0.2, interval=0.02)